@@ -2,3 +2,5 @@ python3 -m venv env
 source env/bin/activate
 pip install pyyaml
 pip install paramiko
+pip install numpy
+pip install matplotlib
@@ -0,0 +1,88 @@
+import logging
+import queue
+import time
+
+import numpy as np
+
+from analysis import group_stats, steady_state
+
+LOG = logging.getLogger('root')
+
+
+# fewest trimmed samples a phase may converge on: t_quantile underestimates the
+# t quantile badly below 5 degrees of freedom (3.85 instead of 4.30 at df=2),
+# which would end a phase on a too narrow interval
+MIN_SAMPLES = 6
+
+
+# relative half width of the confidence interval on the mean of the warm-up
+# trimmed throughput samples of one phase; inf below MIN_SAMPLES kept samples
+def rel_ci(tput, conf=0.95):
+    x = np.asarray(tput, dtype=np.float64)
+    if x.size < MIN_SAMPLES:
+        return float('inf')
+    x = x[steady_state(x, np.zeros(x.size, dtype=np.int64))]
+    st = group_stats(x, np.zeros(x.size, dtype=np.int64), conf=conf)
+    mean = st['mean'][0]
+    if x.size < MIN_SAMPLES or mean <= 0:
+        return float('inf')
+    return (st['ci_hi'][0] - mean) / mean
+
+
+# drives the load generator phase by phase over its stdin instead of a load file
+# with fixed phase lengths: a phase ends once the confidence interval on its
+# mean throughput is within target of the mean, but not before min_time or
+# later than max_time seconds
+class Adaptive:
+
+    def __init__(self, target=0.02, min_time=60, max_time=180, conf=0.95):
+        self.target = target
+        self.min_time = min_time
+        self.max_time = max_time
+        self.conf = conf
+
+    # returns [(pct, seconds, samples, rel_ci)] of the phases run; stops early
+    # when the tail flags the run for abort
+    def drive(self, lm, tail, ext, pcts, warmup, n_srv, n_cli, req_size, sys_props=""):
+        samples = queue.Queue()
+        tail.subscribe(samples.put)
+        phases = []
+        with lm.interactive(sys_props, n_srv, n_cli, req_size) as send:
+            # instances get assigned and clients connect before anything is measured
+            deadline = time.monotonic() + warmup
+            while time.monotonic() < deadline and not tail.aborted():
+                time.sleep(1)
+            send("save " + lm.bench_file(ext))
+            for pct in pcts:
+                if tail.aborted():
+                    break
+                phases.append(self._phase(send, samples, tail, pct))
+            send("exit")
+        LOG.info("adaptive run %s: %s", ext,
+                 ", ".join("%d%% %.0fs (%d samples, ci %.1f%%)" % (p, s, n, 100 * c)
+                           for p, s, n, c in phases))
+        return phases
+
+    def _phase(self, send, samples, tail, pct):
+        send("percentage " + str(pct))
+        started = time.monotonic()
+        # samples of the previous phase may still be in flight
+        while not samples.empty():
+            samples.get_nowait()
+        tput = []
+        ci = float('inf')
+        while not tail.aborted():
+            elapsed = time.monotonic() - started
+            if elapsed >= self.max_time:
+                break
+            try:
+                s = samples.get(timeout=1)
+            except queue.Empty:
+                continue
+            if s[2] != pct:
+                continue
+            tput.append(s[3])
+            ci = rel_ci(tput, self.conf)
+            if elapsed >= self.min_time and ci <= self.target:
+                break
+        return pct, time.monotonic() - started, len(tput), ci
@@ -0,0 +1,193 @@
+import argparse
+import logging
+import math
+
+import numpy as np
+
+from ingest import Store
+
+LOG = logging.getLogger('root')
+
+
+# phases are contiguous blocks of samples with the same read percentage; the
+# load file may visit a percentage twice (50% is run first and again later)
+def split_phases(pct):
+    pct = np.asarray(pct)
+    if pct.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(([0], np.cumsum(pct[1:] != pct[:-1])))
+
+
+# two-sided student t quantile via the Cornish-Fisher expansion around the
+# normal quantile; close enough for confidence intervals from ~5 samples up
+def t_quantile(conf, df):
+    z = math.sqrt(2) * _erfinv(conf)
+    df = np.maximum(np.asarray(df, dtype=np.float64), 1)
+    return (z + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2))
+
+
+def _erfinv(y):
+    # newton iterations on erf, y in (0, 1)
+    x = 0.0
+    for _ in range(50):
+        x -= (math.erf(x) - y) / (2 / math.sqrt(math.pi) * math.exp(-x * x))
+    return x
+
+
+def _bounds(g):
+    starts = np.flatnonzero(np.concatenate(([True], g[1:] != g[:-1])))
+    counts = np.diff(np.concatenate((starts, [g.size])))
+    return starts, counts
+
+
+# MSER truncation per group: drop the first d samples of each group where d
+# (at most half the group) minimises the squared standard error of the rest.
+# x must be ordered by g with groups contiguous; returns a mask of kept samples
+def steady_state(x, g):
+    x = np.asarray(x, dtype=np.float64)
+    if x.size == 0:
+        return np.zeros(0, dtype=bool)
+    starts, counts = _bounds(g)
+    gi = np.repeat(np.arange(starts.size), counts)
+    i = np.arange(x.size) - starts[gi]
+    m = counts[gi] - i
+
+    c1 = np.cumsum(x)
+    c2 = np.cumsum(x * x)
+    ends = starts + counts - 1
+    s1 = c1[ends][gi] - c1 + x
+    s2 = c2[ends][gi] - c2 + x * x
+    var = np.maximum(s2 / m - (s1 / m) ** 2, 0)
+    mser = np.where((i <= counts[gi] // 2) & ((m >= 2) | (i == 0)), var / m, np.inf)
+
+    order = np.lexsort((i, mser, gi))
+    first = order[np.searchsorted(gi[order], np.arange(starts.size))]
+    return i >= i[first][gi]
+
+
+# summary statistics for every group of x in one pass; x ordered by g
+def group_stats(x, g, trimmed=None, conf=0.95):
+    x = np.asarray(x, dtype=np.float64)
+    starts, counts = _bounds(g)
+    n = counts.astype(np.float64)
+    mean = np.add.reduceat(x, starts) / n
+    dev = x - np.repeat(mean, counts)
+    std = np.sqrt(np.add.reduceat(dev * dev, starts) / np.maximum(n - 1, 1))
+    half = t_quantile(conf, n - 1) * std / np.sqrt(n)
+
+    gi = np.repeat(np.arange(starts.size), counts)
+    xs = x[np.lexsort((x, gi))]
+
+    def quantile(q):
+        pos = starts + q * (counts - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, starts + counts - 1)
+        return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+    return dict(n=counts, trimmed=np.zeros_like(counts) if trimmed is None else trimmed,
+                mean=mean, median=quantile(0.5), p5=quantile(0.05), p95=quantile(0.95),
+                std=std, ci_lo=mean - half, ci_hi=mean + half)
+
+
+def _concat(runs):
+    tput, run, phase, pct = [], [], [], []
+    for r, cols in enumerate(runs):
+        ph = split_phases(cols['pct'])
+        tput.append(cols['tput'])
+        run.append(np.full(ph.size, r))
+        phase.append(ph)
+        pct.append(cols['pct'])
+    return (np.concatenate(tput).astype(np.float64), np.concatenate(run),
+            np.concatenate(phase), np.concatenate(pct).astype(np.int64))
+
+
+# per (run, phase) statistics on the warm-up trimmed instantaneous throughput;
+# runs is a list of column dicts as returned by Store.load
+def phase_stats(runs, conf=0.95):
+    x, run, phase, pct = _concat(runs)
+    g = run * (phase.max(initial=0) + 1) + phase
+    keep = steady_state(x, g)
+    starts, counts = _bounds(g)
+    trimmed = counts - np.add.reduceat(keep.astype(np.int64), starts)
+    res = group_stats(x[keep], g[keep], trimmed, conf)
+    res.update(run=run[starts], phase=phase[starts], pct=pct[starts])
+    return res
+
+
+# steady-state throughput samples of all phases of all given runs with their
+# read percentage, ordered by read percentage
+def steady_samples(runs):
+    x, run, phase, pct = _concat(runs)
+    g = run * (phase.max(initial=0) + 1) + phase
+    keep = steady_state(x, g)
+    x, pct = x[keep], pct[keep]
+    order = np.argsort(pct, kind='stable')
+    return x[order], pct[order]
+
+
+# statistics per read percentage pooled over the steady-state samples of all
+# phases of all given runs (e.g. every run of one algorithm/PD/size point)
+def pct_stats(runs, conf=0.95):
+    x, pct = steady_samples(runs)
+    res = group_stats(x, pct, conf=conf)
+    res['pct'] = pct[_bounds(pct)[0]]
+    return res
+
+
+# two-sided mann-whitney u test, normal approximation with tie correction;
+# returns (u of a, p value)
+def mann_whitney(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    n1, n2 = a.size, b.size
+    if n1 == 0 or n2 == 0:
+        return float('nan'), float('nan')
+    x = np.concatenate((a, b))
+    order = np.argsort(x, kind='stable')
+    xs = x[order]
+    starts, counts = _bounds(xs)
+    # average rank of every run of ties
+    ranks = np.empty(x.size)
+    ranks[order] = np.repeat(starts + (counts + 1) / 2.0, counts)
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    var = n1 * n2 / 12.0 * ((n + 1) - (counts ** 3 - counts).sum() / (n * (n - 1)))
+    if var <= 0:
+        return u, 1.0
+    z = (abs(u - n1 * n2 / 2.0) - 0.5) / math.sqrt(var)
+    return u, math.erfc(max(z, 0) / math.sqrt(2))
+
+
+# bootstrap percentile interval of the relative change in mean from a to b (in %)
+def bootstrap_change(a, b, conf=0.95, n=2000, seed=0):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    ma = a[rng.integers(0, a.size, (n, a.size))].mean(axis=1)
+    mb = b[rng.integers(0, b.size, (n, b.size))].mean(axis=1)
+    change = 100.0 * (mb - ma) / ma
+    return tuple(np.quantile(change, [(1 - conf) / 2, (1 + conf) / 2]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="steady-state throughput per read percentage")
+    parser.add_argument('--store', default='../bench-store')
+    parser.add_argument('--algo', default=None)
+    parser.add_argument('--pd', default=None, choices=['True', 'False'])
+    parser.add_argument('--reqsz', default=None, type=int)
+    args = parser.parse_args()
+
+    store = Store(args.store)
+    pd = None if args.pd is None else args.pd == 'True'
+    points = dict()
+    for run_id, m, cols in store.query(args.algo, pd, args.reqsz):
+        points.setdefault((m['algo'], str(m['pd']), m['reqsz']), []).append(cols)
+    for key in sorted(points):
+        st = pct_stats(points[key])
+        print("%s PD=%s %sB (%d runs)" % (key + (len(points[key]),)))
+        print("  pct      n       mean     median        p5        p95      std       95% ci")
+        for k in range(st['pct'].size):
+            print("  %3d %6d %10.1f %10.1f %10.1f %10.1f %8.1f  [%.1f, %.1f]"
+                  % (st['pct'][k], st['n'][k], st['mean'][k], st['median'][k], st['p5'][k],
+                     st['p95'][k], st['std'][k], st['ci_lo'][k], st['ci_hi'][k]))
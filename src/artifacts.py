@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import os
+
+from ssh_client import SshClient, Node
+
+LOG = logging.getLogger('root')
+
+
+# distributes artifacts (fat jar, log4j) to nodes, skipping nodes whose remote
+# copy already has the same sha256 and optionally fanning the upload out
+# node-to-node so the driver uploads each artifact only once
+class ArtifactSync(object):
+
+    __instance = None
+
+    def __new__(cls):
+        if cls.__instance is None:
+            cls.__instance = super(ArtifactSync, cls).__new__(cls)
+            cls.digests = dict()
+        return cls.__instance
+
+    # looked up on every use, the backend is chosen when the topology is loaded
+    @property
+    def ssh(self):
+        return SshClient()
+
+    def local_digest(self, path: str):
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self.digests.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        self.digests[path] = (key, h.hexdigest())
+        return h.hexdigest()
+
+    def remote_digests(self, nodes: dict, dst: str):
+        res = self.ssh.execute_all(nodes, "sha256sum " + dst + " 2>/dev/null")
+        digests = dict()
+        for nid, r in res.items():
+            out = r.stdout.split() if r.ok else []
+            digests[nid] = out[0] if out else None
+        return digests
+
+    # raises RuntimeError if any node ends up without a copy matching src
+    def push(self, nodes: dict, src: str, dst: str, peers=False):
+        digest = self.local_digest(src)
+        # nodes sharing a host (or a shared home) need only one copy
+        uniq = dict()
+        for nid, node in nodes.items():
+            uniq.setdefault((node.hostname, dst), (nid, node))
+        uniq = dict(uniq.values())
+
+        remote = self.remote_digests(uniq, dst)
+        stale = {nid: uniq[nid] for nid in uniq if remote[nid] != digest}
+        LOG.info("artifact %s: %d of %d nodes up to date", src,
+                 len(uniq) - len(stale), len(uniq))
+        if not stale:
+            return
+        if not peers or len(stale) == 1:
+            self.ssh.put_all(stale, src, dst)
+        else:
+            self._seed(stale, src, dst)
+        remote = self.remote_digests(stale, dst)
+        bad = sorted(stale[nid].hostname for nid in stale if remote[nid] != digest)
+        if bad:
+            raise RuntimeError("artifact " + dst + " missing or stale after upload on " + ', '.join(bad))
+
+    # upload to one node, then every node holding the artifact copies it to one
+    # more node per round, doubling the number of seeded nodes each round
+    def _seed(self, nodes: dict, src: str, dst: str):
+        pending = list(nodes)
+        first = pending.pop(0)
+        self.ssh.put(nodes[first], src, dst)
+        seeded = [first]
+        while pending:
+            batch = pending[:len(seeded)]
+            pending = pending[len(seeded):]
+            sources = dict(zip(batch, seeded))
+
+            def copy(nid, node):
+                return self._peer_copy(nodes[sources[nid]], node, dst)
+
+            res = self.ssh.map_nodes({nid: nodes[nid] for nid in batch}, copy)
+            failed = {nid: nodes[nid] for nid, ok in res.items() if ok is not True}
+            if failed:
+                LOG.warning("peer copy of %s failed on %d nodes, uploading from driver",
+                            dst, len(failed))
+                self.ssh.put_all(failed, src, dst)
+            seeded += batch
+
+    def _peer_copy(self, src_node: Node, dst_node: Node, path: str):
+        cmd = ("scp -q -o BatchMode=yes -o StrictHostKeyChecking=no " + path + " "
+               + dst_node.usr + "@" + dst_node.hostname + ":" + path)
+        return self.ssh.execute(src_node, cmd).ok
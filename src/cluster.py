@@ -0,0 +1,266 @@
+import datetime
+import logging
+
+from config import Topology, load_config
+from ssh_client import use_backend
+from containers import ServerContainer, ClientContainer
+from registry import ZooRegistry
+from collector import LoadManager
+from telemetry import Telemetry
+from mntr import MntrScraper, discover, ports_by_node
+from teardown import Teardown
+from timeline import Timeline
+import harvest
+import profiler
+import probes
+
+LOG = logging.getLogger('root')
+
+
+# one benchmark cluster: registry, server containers, client containers and
+# load manager built from the same topology
+class Cluster:
+
+    # telemetry_interval: seconds between host telemetry samples during a run, None to disable
+    # mntr_interval: seconds between zookeeper mntr scrapes during a run, None to disable
+    # profile_pcts: percentage phases to record java flight recordings in, None to disable
+    # profile_roles: jvms to record, 'sic' (servers under test) and/or 'reg'
+    # adaptive: an adaptive.Adaptive ending phases once throughput converged instead of
+    # after exec_time seconds, None for fixed phase lengths
+    # collect_logs: pull compressed logs, console output and configs of every node
+    # into <bench file>.logs at the end of each run
+    # timeline: record lifecycle events and host clock offsets of each run into
+    # <bench file>.timeline (see timeline.merge)
+    def __init__(self, topo: Topology = None, exec_time=180, samples=None, lm_warmup=60, name='',
+                 telemetry_interval=None, mntr_interval=None, profile_pcts=None, profile_roles=('sic',),
+                 adaptive=None, collect_logs=False, timeline=False):
+        self.topo = topo if topo is not None else load_config()
+        use_backend(self.topo.backend)
+        self.name = name
+        self.sic = ServerContainer(self.topo)
+        self.cic = ClientContainer(self.topo)
+        self.reg = ZooRegistry(self.topo)
+        self.lm = LoadManager(self.topo)
+        self.exec_time = exec_time
+        self.samples = samples if samples is not None else [50] + list(range(100, -1, -10))
+        # load generator warm-up once all instance containers are known to be registered
+        self.lm_warmup = lm_warmup
+        self.telemetry_interval = telemetry_interval
+        self.mntr_interval = mntr_interval
+        self.profile_pcts = profile_pcts
+        self.profile_roles = profile_roles
+        self.adaptive = adaptive
+        self.collect_logs = collect_logs
+        self.record_timeline = timeline
+        # timeline of the running test point, if recorded
+        self.tl = None
+        # {sic nid: client ports} of the zookeeper servers under test of the running test point
+        self.sut_ports = dict()
+
+    def setup(self):
+        self.reg.setup()
+        self.sic.setup()
+        self.cic.setup()
+        self.lm.setup()
+
+    # n_sic, n_cic: start instance containers on the first n server/client nodes only
+    def start(self, sys_props, n_sic=None, n_cic=None):
+        sics = list(self.sic.nodes)[:n_sic]
+        cics = list(self.cic.nodes)[:n_cic]
+        if self.topo.backend == 'local':
+            # every zookeeper server on the box would want the admin server port
+            sys_props += ' -Dzookeeper.admin.enableServer=false '
+        LOG.info("starting registry...")
+        self._mark('registry-start')
+        self.reg.start()
+        probes.wait_for_quorum(self.reg)
+        self._mark('registry-ready')
+        LOG.info("starting server ics...")
+        self._mark('sic-start', nids=sics)
+        self.sic.start(sys_props, nids=sics)
+        LOG.info("starting client ics...")
+        self._mark('cic-start', nids=cics)
+        self.cic.start(nids=cics)
+        probes.wait_for_instances(self.reg, ["sic-" + str(nid) for nid in sics]
+                                  + ["cic-" + str(nid) for nid in cics])
+        self._mark('instances-ready')
+
+    def _mark(self, kind, **fields):
+        if self.tl is not None:
+            self.tl.event(kind, **fields)
+
+    # one script per host: kill the load manager (lm) and the instance containers
+    # and registry (stop) by recorded pid and wait for the registry ports and those
+    # of the servers under test to be released, then delete run data (data) or
+    # every remote dir (destroy); returns the hosts whose script failed
+    def teardown(self, lm=False, stop=False, data=False, destroy=False):
+        td = Teardown()
+        if lm:
+            td.add({0: self.lm.host}, self.lm.stop_cmd())
+        if stop:
+            td.add(self.cic.nodes, self.cic.stop_cmds())
+            td.add(self.sic.nodes, self.sic.stop_cmds())
+            td.add(self.reg.nodes, self.reg.stop_cmd())
+            td.add(self.reg.nodes, self.reg.ports_free_cmd())
+            if self.sut_ports:
+                td.add({nid: self.sic.nodes[nid] for nid in self.sut_ports},
+                       self.sic.ports_free_cmds(self.sut_ports))
+        if data:
+            td.add(self.sic.nodes, self.sic.del_data_cmd())
+            td.add(self.reg.nodes, self.reg.del_data_cmd())
+        if destroy:
+            td.add(self.cic.nodes, self.cic.destroy_cmd())
+            td.add(self.sic.nodes, self.sic.destroy_cmd())
+            td.add(self.reg.nodes, self.reg.destroy_cmd())
+            td.add({0: self.lm.host}, self.lm.destroy_cmd())
+        self._mark('teardown', lm=lm, stop=stop, data=data, destroy=destroy)
+        failed = td.run()
+        self._mark('teardown-done', failed=failed)
+        return failed
+
+    def stop(self):
+        LOG.info("stopping client ics, server ics and registry...")
+        self.teardown(stop=True)
+
+    def destroy(self):
+        self.teardown(destroy=True)
+
+    def cleanall(self):
+        LOG.info("stopping collector, ics and registry...")
+        self.teardown(lm=True, stop=True, destroy=True)
+
+    def del_data(self):
+        self.teardown(data=True)
+
+    # every host taking part in a run, keyed by role
+    def role_nodes(self):
+        nodes = dict()
+        for nid, node in self.reg.nodes.items():
+            nodes['reg-' + str(nid)] = node
+        for nid, node in self.sic.nodes.items():
+            nodes['sic-' + str(nid)] = node
+        for nid, node in self.cic.nodes.items():
+            nodes['cic-' + str(nid)] = node
+        nodes['lm'] = self.lm.host
+        return nodes
+
+    # bring the cluster back to a clean state after a failed test point
+    def recover(self):
+        LOG.info("%s: recovering after failed test point...", self.name)
+        self._mark('failed')
+        failed = self.teardown(lm=True, stop=True, data=True)
+        self.sut_ports = dict()
+        self._end_timeline()
+        if failed:
+            LOG.warning("%s: teardown still failing on %s", self.name, ', '.join(failed))
+
+    # client ports of the servers under test as reported to the registry (found
+    # by the mntr scraper already if it ran), per server container node
+    def _find_sut_ports(self, scraper=None):
+        found = scraper.targets if scraper is not None else discover(self.reg)
+        found = {k: v for k, v in found.items() if not k.startswith('registry-')}
+        return ports_by_node(found, self.sic.nodes)
+
+    def _end_timeline(self):
+        if self.tl is not None:
+            self.tl.clocks(self.role_nodes())
+            self.tl.event('run-end')
+            self.tl.close()
+            self.tl = None
+
+    # load: load manager phase commands of a load profile (loadprofile.Profile.points)
+    # instead of the samples run exec_time seconds each
+    # n_sic, n_cic: number of server/client instance container nodes to use, all if None
+    # returns the local path of the pulled bench file, or None if the run was aborted
+    # or its data could not be pulled; raises RuntimeError if teardown left ports
+    # bound, so that the point is retried (Scheduler) or the sweep stops
+    def run_test(self, name='', algo='', sys_prop='', reqsz=1024, servers=3, clients=900, load=None,
+                 n_sic=None, n_cic=None):
+        LOG.info("BENCH: %s", name)
+        LOG.info("__config__ - props:%s reqsz:%s server:%s clients:%s",
+                 sys_prop, reqsz, servers, clients)
+        da = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        if self.record_timeline:
+            self.tl = Timeline(self.lm.bench_dir + '/' + name + '_' + da + '.timeline', name)
+            self._mark('run-start', algo=algo, sys_prop=sys_prop, reqsz=reqsz, servers=servers, clients=clients)
+            self.tl.clocks(self.role_nodes())
+
+        # start registry and instance containers
+        self.start(sys_prop, n_sic, n_cic)
+
+        self.lm.clear_bench(name)
+        # a load profile fixes its own phase lengths
+        adaptive = self.adaptive if load is None else None
+        if adaptive is None:
+            tm = self.lm.gen_load_file(self.exec_time, name, self.samples, warmup=self.lm_warmup, load=load)
+            if self.tl is not None:
+                self.tl.plan(self.lm.load_data_file)
+
+            LOG.info("start load manager...")
+            self._mark('lm-start', host=self.lm.host.hostname)
+            self.lm.start("", servers, clients, reqsz)
+
+        # pollers started below are stopped whatever happens, or every failed point
+        # would leave another set of them running against the nodes
+        tel = scraper = tail = None
+        try:
+            if self.telemetry_interval:
+                tel = Telemetry(self.role_nodes(), self.lm.bench_dir + '/' + name + '_' + da + '.telemetry',
+                                self.telemetry_interval)
+                tel.start()
+                self._mark('file', role='telemetry', path=tel.out)
+            if self.mntr_interval:
+                scraper = MntrScraper(self.reg, self.lm.bench_dir + '/' + name + '_' + da + '.mntr',
+                                      self.mntr_interval, n_servers=servers)
+                scraper.start()
+                self._mark('file', role='mntr', path=scraper.out)
+
+            LOG.info("waiting...")
+            tail = self.lm.tail(name, start_timeout=self.lm_warmup + 60, expected=self.lm.expected_levels(name))
+            if self.tl is not None:
+                tail.subscribe(self.tl.on_sample)
+            prof = None
+            if self.profile_pcts:
+                prof = profiler.PhaseProfiler(profiler.targets(self, self.profile_roles), name, self.profile_pcts,
+                                              self.lm.bench_dir + '/' + name + '_' + da + '.jfr')
+                tail.subscribe(prof.on_sample)
+            if adaptive is None:
+                probes.wait_for_lm_exit(self.lm, tm, abort=tail.aborted)
+            else:
+                LOG.info("drive load manager until each phase converges...")
+                self._mark('lm-start', host=self.lm.host.hostname)
+                adaptive.drive(self.lm, tail, name, self.samples, self.lm_warmup, servers, clients, reqsz)
+            tail.stop()
+            self._mark('lm-exit')
+            if prof is not None:
+                LOG.info("pull flight recordings...")
+                if prof.finish():
+                    profiler.collapse_dir(prof.out_dir, self.lm.bench_dir + '/' + name + '_' + da + '.collapsed')
+                self._mark('profiles-pulled')
+        finally:
+            for poller in (tail, tel, scraper):
+                if poller is not None:
+                    poller.stop()
+        self.sut_ports = self._find_sut_ports(scraper)
+        if tail.aborted():
+            LOG.warning("BENCH: %s aborted early - %s", name, tail.reason)
+            self._mark('aborted', reason=tail.reason)
+
+        LOG.info("pull bench data file...")
+        bench = self.lm.get_bench_data(name)
+        self._mark('file', role='bench', path=bench)
+        if self.collect_logs:
+            LOG.info("collect logs...")
+            logs = self.lm.bench_dir + '/' + name + '_' + da + '.logs'
+            harvest.Harvester(harvest.targets(self, name)).collect(logs)
+            self._mark('file', role='logs', path=logs)
+
+        LOG.info("stop load manager, ics and registry and delete data...")
+        # stop everything and delete data from this run in one go per host
+        failed = self.teardown(lm=True, stop=True, data=True)
+        self.sut_ports = dict()
+        self._end_timeline()
+        if failed:
+            raise RuntimeError("BENCH: " + name + ": teardown failed on " + ', '.join(failed)
+                               + ", ports may still be bound")
+        return None if tail.aborted() else bench
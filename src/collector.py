@@ -1,36 +1,48 @@
 import logging
-import yaml
+import threading
+import time
 import datetime
+import os
 import random
+import re
+from contextlib import contextmanager
 
+from artifacts import ArtifactSync
+from config import Topology, load_config
+from harvest import gc_log_opt
+from ingest import parse_lines, read_samples
 from ssh_client import SshClient, Node
+from teardown import kill_cmd
 
 LOG = logging.getLogger('root')
 
 
 class LoadManager:
 
-    def __init__(self):
+    # topo: cluster topology, the default one from config.yml if not given
+    def __init__(self, topo: Topology = None):
         self.ssh = SshClient()
-        self.cfg = {}
-        with open('config.yml', 'r') as f:
-            self.conf = yaml.load(f, Loader=yaml.FullLoader)
-            self.cfg = self.conf['load-manager']
-            self.registry = list(self.conf['registry']['nodes'].values())[0]
-            self.registry_port = self.conf['registry']['clientPort']
-        self.host = Node(self.cfg['host'], str(self.cfg['user']),
-                                   self.cfg['passwd'], self.cfg['passwordLess'])
-        self.cwd = self.cfg['cwd']
-        self.jar = self.conf['artifacts']['fat-jar']
+        self.sync = ArtifactSync()
+        self.topo = topo if topo is not None else load_config()
+        self.cfg = self.topo.load_manager
+        self.registry = self.topo.registry_host
+        self.registry_port = self.topo.registry.client_port
+        self.host = Node(self.cfg.host, self.cfg.user,
+                                   self.cfg.passwd, self.cfg.passwd_less)
+        self.cwd = self.cfg.cwd
+        self.jar = self.topo.artifacts.fat_jar
         self.jar_remote = self.cwd + '/' + self.jar.split('/')[-1]
-        self.log4j = self.conf['artifacts']['log4j']
+        self.log4j = self.topo.artifacts.log4j
         self.log4j_remote = self.cwd + '/log4j.properties'
-        self.load_data_file = "load.dat"
+        # local name of the generated load file; distinct per cluster slot when running concurrently
+        self.load_data_file = self.cfg.load_file
+        self.bench_dir = self.topo.paths.bench_data
 
 
     def setup(self):
         # create dirs
         self.create_dirs()
+        os.makedirs(self.bench_dir, exist_ok=True)
         # copy jar to working dir
         self.put_jar()
         # copy log4j file
@@ -40,27 +52,65 @@ class LoadManager:
         cmd = ("java "
                + sys_props
                + " -Dzookeeper.log.dir=" + self.cwd
+               + gc_log_opt(self.cwd)
                + " -Dlog4j.configuration=file:" + self.log4j_remote
                + " -jar " + self.jar_remote + " generateLoad --leaderServes "
                + self.registry + ":" + str(self.registry_port)
                + " /generateLoad "
                + str(n_srv) + " " + str(n_cli) + " " + str(req_size) + " < "
-               + self.cwd + '/' + self.load_data_file
-               + " &")
-        self.ssh.execute(self.host, cmd)
+               + self.cwd + '/' + self.load_data_file)
+        self.ssh.spawn(self.host, cmd, self.pid_file, self.cwd + '/generateLoad.out')
 
-    def gen_load_file(self, sleep_dur, ext, samples):
+    @property
+    def pid_file(self):
+        return self.cwd + '/lm.pid'
+
+    # runs the load generator for as long as the block lasts, reading its commands
+    # from the ssh channel instead of the load file; yields a function sending one
+    # command line (e.g. "percentage 70")
+    @contextmanager
+    def interactive(self, sys_props, n_srv, n_cli, req_size):
+        # the shell records its pid and becomes the load generator
+        cmd = ("echo $$ > " + self.pid_file + "; exec java "
+               + sys_props
+               + " -Dzookeeper.log.dir=" + self.cwd
+               + gc_log_opt(self.cwd)
+               + " -Dlog4j.configuration=file:" + self.log4j_remote
+               + " -jar " + self.jar_remote + " generateLoad --leaderServes "
+               + self.registry + ":" + str(self.registry_port)
+               + " /generateLoad "
+               + str(n_srv) + " " + str(n_cli) + " " + str(req_size)
+               + " > " + self.cwd + "/generateLoad.out 2>&1")
+        with self.ssh.session(self.host, cmd) as (stdin, stdout):
+            def send(line):
+                LOG.info("load manager <- %s", line)
+                stdin.write(line + "\n")
+                stdin.flush()
+
+            yield send
+            # give the load generator a moment to act on a final exit
+            SshClient._wait_exit(stdout.channel, 30)
+
+    # warmup: seconds the load generator idles before the first phase so that
+    # instances get assigned and clients connect
+    # load: phase commands (see loadprofile) replacing the samples run sleep_dur each
+    def gen_load_file(self, sleep_dur, ext, samples, warmup=150, load=None):
         time = 60
         #samples = random.sample(range(0, 101, 10), 11)
-        gen_out = self.cwd + "/bench." + ext
+        if load is None:
+            load = []
+            for per in samples:
+                load.append("percentage " + str(per))
+                load.append("sleep " + str(sleep_dur))
+        gen_out = self.bench_file(ext)
         with open(self.load_data_file, 'w') as f:
-            f.write("sleep 150\n")
-            time += 150
+            f.write("sleep " + str(warmup) + "\n")
+            time += warmup
             f.write("save " + gen_out + "\n")
-            for per in samples:
-                f.write("percentage " + str(per) + "\n")
-                f.write("sleep " + str(sleep_dur) + "\n")
-                time += sleep_dur
+            for cmd in load:
+                f.write(cmd + "\n")
+                if cmd.startswith("sleep "):
+                    time += int(cmd.split()[1])
             f.write("exit\n")
 
         # copy load file
@@ -69,36 +119,180 @@ class LoadManager:
         # time in seconds executor should wait before killing lm
         return time
 
+    def stop_cmd(self):
+        return kill_cmd(self.pid_file, self.jar_remote)
+
     def stop(self):
-        cmd = ("ps aux | grep -v grep | grep " + self.jar_remote
-               + " | awk '{print $2}' | xargs kill -9")
-        self.ssh.execute(self.host, cmd)
+        self.ssh.execute(self.host, self.stop_cmd())
+
+    def destroy_cmd(self):
+        return "rm -rf " + self.cwd
 
     def destroy(self):
-        self.ssh.execute(self.host, "rm -rf " + self.cwd)
+        self.ssh.execute(self.host, self.destroy_cmd())
 
     def create_dirs(self):
         self.ssh.execute(self.host, "mkdir -p " + self.cwd)
 
     def put_jar(self):
-        self.ssh.put(self.host, self.jar, self.jar_remote)
+        self.sync.push({0: self.host}, self.jar, self.jar_remote)
 
     def put_loadfile(self):
         self.ssh.put(self.host, self.load_data_file, self.cwd + '/' + self.load_data_file)
 
     def put_log4j(self):
-        self.ssh.put(self.host, self.log4j, self.log4j_remote)
+        self.sync.push({0: self.host}, self.log4j, self.log4j_remote)
+
+    # remote file the load generator saves the samples of test point ext to
+    def bench_file(self, ext):
+        return self.cwd + '/bench.' + ext
+
+    # a bench file left by an earlier run of the same test point (retry, resume,
+    # knee re-run) would be tailed from its first, stale sample
+    def clear_bench(self, ext):
+        self.ssh.execute(self.host, "rm -f " + self.bench_file(ext))
 
     def get_bench_data(self, ext):
         da = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        src = self.cwd + '/bench.' + ext
-        dst = "/srv/home/013736658/zkupshot/bench-data/" + ext + "_" + da
+        src = self.bench_file(ext)
+        dst = self.bench_dir + '/' + ext + "_" + da
         try:
             self.ssh.get(self.host, src, dst)
-        except:
-            pass
+        except Exception as e:
+            LOG.warning("failed to pull bench data %s:%s - %s", self.host.hostname, src, e)
+            return None
+        return dst
+
+    # median throughput per read percentage of the latest bench file of test point
+    # ext pulled into bench_dir earlier, the level a new run of it should reach
+    def expected_levels(self, ext):
+        pat = re.compile(re.escape(ext) + r'_\d{14}$')
+        found = sorted(f for f in os.listdir(self.bench_dir) if pat.match(f)) if os.path.isdir(self.bench_dir) else []
+        for f in reversed(found):
+            levels = levels_of(read_samples(os.path.join(self.bench_dir, f))[0])
+            if levels:
+                return levels
+        return None
 
-        #self.ssh.get(self.host, self.cwd + '/bench.' + ext, "/srv/home/013736658/zkupshot/bench-data/" + da + "." + ext)
+    # follow the remote bench file while the load generator is running
+    def tail(self, ext, **kwargs):
+        t = LiveTail(self.ssh, self.host, self.bench_file(ext), **kwargs)
+        t.start()
+        return t
 
     def close_all_cnxs(self):
         self.ssh.close(self.host)
+
+
+# {pct: median throughput} of bench samples
+def levels_of(samples):
+    per_pct = dict()
+    for s in samples:
+        per_pct.setdefault(s[2], []).append(s[3])
+    return {pct: sorted(v)[len(v) // 2] for pct, v in per_pct.items()}
+
+
+# streams samples appended to a remote bench file by reading only the bytes
+# past the last complete line, and flags the run for abort if the file stops
+# growing or throughput collapses within a phase
+class LiveTail(threading.Thread):
+
+    # start_timeout: seconds to wait for the first samples, pass the load file warm-up on top
+    # stall_timeout: seconds without new samples after that before giving up on the run
+    # expected: {pct: throughput} of a reference run of the test point (see
+    # LoadManager.expected_levels); a phase whose last collapse_samples samples stay
+    # below expected_ratio of its level is aborted. Without it, or for a percentage
+    # it lacks, only a drop against the phase's own median counts (collapse_ratio)
+    def __init__(self, ssh: SshClient, host: Node, path: str, interval=6, start_timeout=60,
+                 stall_timeout=60, collapse_ratio=0.2, collapse_samples=5, expected=None, expected_ratio=0.5):
+        super(LiveTail, self).__init__(daemon=True)
+        self.ssh = ssh
+        self.host = host
+        self.path = path
+        self.interval = interval
+        self.start_timeout = start_timeout
+        self.stall_timeout = stall_timeout
+        self.collapse_ratio = collapse_ratio
+        self.collapse_samples = collapse_samples
+        self.expected = expected or dict()
+        self.expected_ratio = expected_ratio
+        self.offset = 0
+        self.samples = []
+        self.callbacks = []
+        self.reason = None
+        self.phase = []
+        self.last_growth = time.monotonic()
+        self.done = threading.Event()
+
+    # fn is called with every parsed sample (seq, secs_of_day, pct, tput, min, mean, max)
+    def subscribe(self, fn):
+        self.callbacks.append(fn)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def aborted(self):
+        return self.reason is not None
+
+    def run(self):
+        try:
+            with self.ssh.sftp(self.host) as sftp:
+                while not self.done.wait(self.interval):
+                    self.poll(sftp)
+                    if self.aborted():
+                        LOG.warning("live tail of %s: %s", self.path, self.reason)
+                        return
+                # pick up whatever was written before the load generator exited
+                self.poll(sftp)
+        except Exception as e:
+            LOG.warning("live tail of %s:%s stopped - %s", self.host.hostname, self.path, e)
+
+    def poll(self, sftp):
+        try:
+            size = sftp.stat(self.path).st_size
+        except IOError:
+            size = 0
+        if size > self.offset:
+            with sftp.open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+            end = data.rfind(b'\n') + 1
+            self.offset += end
+            for sample in parse_lines(data[:end].decode(errors='replace').splitlines(True)):
+                self.add(sample)
+            self.last_growth = time.monotonic()
+            return
+        limit = self.stall_timeout if self.offset else self.start_timeout
+        if time.monotonic() - self.last_growth > limit:
+            self.reason = "no new samples for " + str(limit) + "s"
+
+    def add(self, sample):
+        self.samples.append(sample)
+        for fn in self.callbacks:
+            fn(sample)
+        if self.phase and self.phase[-1][2] != sample[2]:
+            self.phase = []
+        self.phase.append(sample)
+        if self.collapsed():
+            self.reason = ("throughput collapsed at " + str(sample[2]) + "% reads: "
+                           + str([s[3] for s in self.phase[-self.collapse_samples:]])
+                           + (", expected " + str(self.expected[sample[2]]) if sample[2] in self.expected else ""))
+
+    # the last collapse_samples samples are all below expected_ratio of the
+    # reference level of the phase, or below collapse_ratio of the median of the
+    # phase before them (or zero right from the phase start)
+    def collapsed(self):
+        recent = [s[3] for s in self.phase[-self.collapse_samples:]]
+        if len(recent) < self.collapse_samples:
+            return False
+        if max(recent) == 0:
+            return True
+        level = self.expected.get(self.phase[-1][2])
+        if level and max(recent) < self.expected_ratio * level:
+            return True
+        before = sorted(s[3] for s in self.phase[:-self.collapse_samples])
+        if len(before) < 3:
+            return False
+        ref = before[len(before) // 2]
+        return max(recent) < self.collapse_ratio * ref
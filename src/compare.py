@@ -0,0 +1,93 @@
+import argparse
+import logging
+import os
+import sys
+
+import numpy as np
+
+from analysis import _bounds, bootstrap_change, mann_whitney, steady_samples
+from ingest import parse_name, read_samples, to_columns
+
+LOG = logging.getLogger('root')
+
+
+# bench runs under the given files or directories, as columns per test point
+# (algo, pd, reqsz, load profile tag)
+def load_runs(roots):
+    points = dict()
+    for root in roots:
+        paths = [root] if os.path.isfile(root) else \
+            [os.path.join(d, f) for d, _, files in os.walk(root) for f in sorted(files)]
+        for path in paths:
+            m = parse_name(path)
+            if m is None:
+                continue
+            rows, _ = read_samples(path)
+            if rows:
+                points.setdefault((m['algo'], m['pd'], m['reqsz'], m['tag']), []).append(to_columns(rows)[0])
+    return points
+
+
+def _by_pct(runs):
+    x, pct = steady_samples(runs)
+    starts, counts = _bounds(pct)
+    return {int(pct[s]): x[s:s + c] for s, c in zip(starts, counts)}
+
+
+# matches test points of both sweeps by algo/PD/size/read percentage and tests
+# the steady-state throughput samples of each; a point regresses when its mean
+# dropped by more than threshold % and the drop is significant at alpha
+def compare(base: dict, new: dict, threshold=5.0, alpha=0.01, conf=0.95):
+    rows = []
+    for key in sorted(set(base) & set(new), key=str):
+        b, n = _by_pct(base[key]), _by_pct(new[key])
+        for pct in sorted(set(b) & set(n)):
+            if b[pct].size < 2 or n[pct].size < 2:
+                continue
+            change = 100.0 * (n[pct].mean() - b[pct].mean()) / b[pct].mean()
+            _, p = mann_whitney(b[pct], n[pct])
+            lo, hi = bootstrap_change(b[pct], n[pct], conf)
+            rows.append(dict(algo=key[0] if key[3] is None else key[0] + ' ' + key[3],
+                             pd=key[1], reqsz=key[2], pct=pct,
+                             n_base=b[pct].size, n_new=n[pct].size,
+                             base=b[pct].mean(), new=n[pct].mean(), change=change,
+                             ci_lo=lo, ci_hi=hi, p=p,
+                             regressed=bool(change < -threshold and p < alpha and hi < 0)))
+    missing = sorted(set(base) ^ set(new), key=str)
+    if missing:
+        LOG.warning("test points only in one sweep: %s", missing)
+    return rows
+
+
+def print_table(rows, out=sys.stdout):
+    out.write("%-10s %-5s %7s %4s %6s %6s %10s %10s %8s %18s %9s\n"
+              % ('algo', 'PD', 'reqsz', 'pct', 'n_base', 'n_new', 'base', 'new', 'change',
+                 '95% ci', 'p'))
+    for r in rows:
+        out.write("%-10s %-5s %7d %4d %6d %6d %10.1f %10.1f %+7.1f%% [%+6.1f%%, %+6.1f%%] %9.2g%s\n"
+                  % (r['algo'], r['pd'], r['reqsz'], r['pct'], r['n_base'], r['n_new'], r['base'],
+                     r['new'], r['change'], r['ci_lo'], r['ci_hi'], r['p'],
+                     '  REGRESSED' if r['regressed'] else ''))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s: %(message)s")
+    parser = argparse.ArgumentParser(
+        description="compare the steady-state throughput of a sweep against a baseline sweep; "
+                    "exits with 1 if any test point regressed")
+    parser.add_argument('baseline', nargs='+', help="bench files or directories of the baseline sweep")
+    parser.add_argument('--new', nargs='+', required=True, help="bench files or directories of the new sweep")
+    parser.add_argument('--threshold', type=float, default=5.0,
+                        help="throughput drop in %% that counts as a regression")
+    parser.add_argument('--alpha', type=float, default=0.01, help="significance level")
+    parser.add_argument('--all', action='store_true', help="print every point, not only regressions")
+    args = parser.parse_args()
+
+    rows = compare(load_runs(args.baseline), load_runs(args.new), args.threshold, args.alpha)
+    if not rows:
+        print("no common test points")
+        sys.exit(2)
+    regressed = [r for r in rows if r['regressed']]
+    print_table(rows if args.all else regressed)
+    print("%d of %d test points regressed by more than %.1f%%" % (len(regressed), len(rows), args.threshold))
+    sys.exit(1 if regressed else 0)
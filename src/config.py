@@ -0,0 +1,242 @@
+import copy
+import functools
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+LOG = logging.getLogger('root')
+
+
+@dataclass(frozen=True, slots=True)
+class RegistryConfig:
+    nodes: Dict[int, str]
+    user: str
+    passwd: Optional[str]
+    passwd_less: bool
+    cwd: str
+    data_dir: str
+    client_port: int
+    quorum_port: int
+    election_port: int
+    tick_time: int
+    init_limit: int
+    sync_limit: int
+    flw_whitelist: str
+    java_sys_props: str
+
+
+@dataclass(frozen=True, slots=True)
+class ServerContainersConfig:
+    nodes: Dict[int, str]
+    user: str
+    passwd: Optional[str]
+    passwd_less: bool
+    cwd: str
+    ic_test_dir: str
+    ic_data_dir: str
+    ic_log_dir: str
+
+
+@dataclass(frozen=True, slots=True)
+class ClientContainersConfig:
+    nodes: Dict[int, str]
+    user: str
+    passwd: Optional[str]
+    passwd_less: bool
+    cwd: str
+
+
+@dataclass(frozen=True, slots=True)
+class LoadManagerConfig:
+    host: str
+    user: str
+    passwd: Optional[str]
+    passwd_less: bool
+    cwd: str
+    load_file: str
+
+
+@dataclass(frozen=True, slots=True)
+class ArtifactsConfig:
+    fat_jar: str
+    log4j: str
+    peer_seeding: bool
+
+
+@dataclass(frozen=True, slots=True)
+class PathsConfig:
+    bench_data: str
+    ledger: str
+
+
+@dataclass(frozen=True, slots=True)
+class SchedulerConfig:
+    slots: int
+    hosts: List[str]
+    slot_shape: Dict[str, int]
+
+
+@dataclass(frozen=True, slots=True)
+class Topology:
+    name: str
+    registry: RegistryConfig
+    server_containers: ServerContainersConfig
+    client_containers: ClientContainersConfig
+    load_manager: LoadManagerConfig
+    artifacts: ArtifactsConfig
+    paths: PathsConfig
+    scheduler: SchedulerConfig
+    # 'ssh', or 'local' to run the whole cluster on this machine
+    backend: str
+    # the merged yaml the topology was built from
+    raw: dict = field(repr=False, compare=False)
+
+    # first registry node; instance containers and the load manager connect to it
+    @property
+    def registry_host(self):
+        return list(self.registry.nodes.values())[0]
+
+
+@functools.lru_cache(maxsize=None)
+def _read(path: str):
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=yaml.FullLoader)
+
+
+def _merge(base: dict, over: dict):
+    res = copy.deepcopy(base)
+    for k, v in over.items():
+        if isinstance(v, dict) and isinstance(res.get(k), dict) and k != 'nodes':
+            res[k] = _merge(res[k], v)
+        else:
+            res[k] = copy.deepcopy(v)
+    return res
+
+
+# keys _build reads with a default, which an override may set though the file does not
+_OPTIONAL = ('load-manager.load-file', 'artifacts.peer-seeding', 'backend')
+
+
+# key.path=value, where a path element may itself contain dots
+# (registry.admin.4lw.commands.whitelist=*); the value is parsed as yaml, or
+# taken as a plain string where it is not valid yaml. The key must exist
+def _override(conf: dict, expr: str):
+    if '=' not in expr:
+        raise ValueError("override must be key.path=value: " + expr)
+    key, value = expr.split('=', 1)
+    parts = key.split('.')
+    d = conf
+    while len(parts) > 1 and '.'.join(parts) not in d:
+        for i in range(len(parts) - 1, 0, -1):
+            k = '.'.join(parts[:i])
+            if isinstance(d.get(k), dict):
+                d, parts = d[k], parts[i:]
+                break
+        else:
+            raise ValueError("unknown config key: " + key)
+    if '.'.join(parts) not in d and key not in _OPTIONAL:
+        raise ValueError("unknown config key: " + key)
+    try:
+        v = yaml.safe_load(value)
+    except yaml.YAMLError:
+        v = value
+    d['.'.join(parts)] = v
+
+
+def _str(v):
+    return '' if v is None else str(v)
+
+
+def _build(name: str, c: dict):
+    reg, sic, cic, lm = (c['registry'], c['server-containers'],
+                         c['client-containers'], c['load-manager'])
+    reg_cwd = reg['cwd-prefix']
+    data_dir = reg['dataDir']
+    # if path is relative create data dir under working directory
+    if not data_dir.startswith('/'):
+        data_dir = reg_cwd + '/' + data_dir
+    sched = c.get('scheduler') or dict()
+    return Topology(
+        name=name,
+        registry=RegistryConfig(
+            nodes=dict(reg['nodes']), user=str(reg['user']), passwd=reg['passwd'],
+            passwd_less=bool(reg['passwordLess']), cwd=reg_cwd, data_dir=data_dir,
+            client_port=reg['clientPort'], quorum_port=reg['quorumPort'],
+            election_port=reg['leaderElectionPort'], tick_time=reg['tickTime'],
+            init_limit=reg['initLimit'], sync_limit=reg['syncLimit'],
+            flw_whitelist=str(reg['admin']['4lw.commands.whitelist']),
+            java_sys_props=_str(reg['java-sys-properties'])),
+        server_containers=ServerContainersConfig(
+            nodes=dict(sic['nodes']), user=str(sic['user']), passwd=sic['passwd'],
+            passwd_less=bool(sic['passwordLess']), cwd=sic['cwd-prefix'],
+            ic_test_dir=sic['icTestDir'], ic_data_dir=sic['icDataDir'],
+            ic_log_dir=sic['icDataLogDir']),
+        client_containers=ClientContainersConfig(
+            nodes=dict(cic['nodes']), user=str(cic['user']), passwd=cic['passwd'],
+            passwd_less=bool(cic['passwordLess']), cwd=cic['cwd-prefix']),
+        load_manager=LoadManagerConfig(
+            host=lm['host'], user=str(lm['user']), passwd=lm['passwd'],
+            passwd_less=bool(lm['passwordLess']), cwd=lm['cwd'],
+            load_file=lm.get('load-file', 'load.dat')),
+        artifacts=ArtifactsConfig(
+            fat_jar=c['artifacts']['fat-jar'], log4j=c['artifacts']['log4j'],
+            peer_seeding=bool(c['artifacts'].get('peer-seeding', False))),
+        paths=PathsConfig(bench_data=c['paths']['bench-data'], ledger=c['paths']['ledger']),
+        scheduler=SchedulerConfig(
+            slots=int(sched.get('slots', 1)), hosts=list(sched.get('hosts') or []),
+            slot_shape=dict(sched.get('slot-shape') or dict())),
+        backend=str(c.get('backend', 'ssh')),
+        raw=c)
+
+
+def validate(t: Topology):
+    errors = []
+    for role, cfg in (('registry', t.registry), ('server-containers', t.server_containers),
+                      ('client-containers', t.client_containers)):
+        if not cfg.nodes:
+            errors.append(role + ": no nodes")
+        if not cfg.user:
+            errors.append(role + ": no user")
+        if not cfg.passwd_less and not cfg.passwd:
+            errors.append(role + ": passwordLess is off but no passwd given")
+    if not t.load_manager.host:
+        errors.append("load-manager: no host")
+    for k in ('client_port', 'quorum_port', 'election_port'):
+        port = getattr(t.registry, k)
+        if not isinstance(port, int) or not 0 < port < 65536:
+            errors.append("registry: invalid " + k + ": " + str(port))
+    if t.backend not in ('ssh', 'local'):
+        errors.append("backend: must be ssh or local, not " + t.backend)
+    for k, v in t.scheduler.slot_shape.items():
+        if not isinstance(v, int) or v < 0:
+            errors.append("scheduler.slot-shape." + k + ": invalid count " + str(v))
+    if errors:
+        raise ValueError("invalid config (" + t.name + "):\n  " + "\n  ".join(errors))
+    return t
+
+
+# parse, merge and validate config once per (path, topology, overrides); named
+# topologies under `topologies:` are merged over the top-level sections
+@functools.lru_cache(maxsize=None)
+def load_config(path='config.yml', topology: Optional[str] = None,
+                overrides: Tuple[str, ...] = ()):
+    raw = _read(path)
+    conf = {k: v for k, v in raw.items() if k != 'topologies'}
+    if topology is not None:
+        named = raw.get('topologies') or dict()
+        if topology not in named:
+            raise ValueError("unknown topology " + topology + ", have: " + str(sorted(named)))
+        conf = _merge(conf, named[topology])
+    else:
+        conf = copy.deepcopy(conf)
+    for expr in overrides:
+        _override(conf, expr)
+    try:
+        t = _build(topology or 'default', conf)
+    except KeyError as e:
+        raise ValueError("invalid config (" + (topology or 'default') + "): missing key " + str(e))
+    validate(t)
+    LOG.info("loaded config %s (topology: %s, overrides: %s)", path, t.name, list(overrides))
+    return t
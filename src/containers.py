@@ -1,38 +1,42 @@
 import logging
-import yaml
 
+from artifacts import ArtifactSync
+from config import Topology, load_config
+from harvest import gc_log_opt
 from ssh_client import SshClient, Node
+from teardown import kill_cmd, ports_free_cmd
 
 LOG = logging.getLogger('root')
 
 
 class ServerContainer:
 
-    def __init__(self):
+    # topo: cluster topology, the default one from config.yml if not given
+    def __init__(self, topo: Topology = None):
         self.ssh = SshClient()
-        self.cfg = {}
-        with open('config.yml', 'r') as f:
-            self.conf = yaml.load(f, Loader=yaml.FullLoader)
-            self.cfg = self.conf['server-containers']
-            self.registry = list(self.conf['registry']['nodes'].values())[0]
-            self.registry_port = self.conf['registry']['clientPort']
+        self.sync = ArtifactSync()
+        self.topo = topo if topo is not None else load_config()
+        self.cfg = self.topo.server_containers
+        self.registry = self.topo.registry_host
+        self.registry_port = self.topo.registry.client_port
         self.nodes = dict()
-        for nid in self.cfg['nodes']:
-            self.nodes[nid] = Node(self.cfg['nodes'][nid], str(self.cfg['user']),
-                                   self.cfg['passwd'], self.cfg['passwordLess'])
-        # self.cwd = self.cfg['cwd-prefix'] + datetime.datetime.now().strftime('-%Y%m%d%H%M%S')
-        self.cwd = self.cfg['cwd-prefix']
-        self.jar = self.conf['artifacts']['fat-jar']
+        for nid in self.cfg.nodes:
+            self.nodes[nid] = Node(self.cfg.nodes[nid], self.cfg.user,
+                                   self.cfg.passwd, self.cfg.passwd_less)
+        # self.cwd = self.cfg.cwd + datetime.datetime.now().strftime('-%Y%m%d%H%M%S')
+        self.cwd = self.cfg.cwd
+        self.jar = self.topo.artifacts.fat_jar
         self.jar_remote = self.cwd + '/' + self.jar.split('/')[-1]
-        self.ic_test_dir = self.cfg['icTestDir']
-        self.ic_data_dir = self.cfg['icDataDir']
-        self.ic_log_dir = self.cfg['icDataLogDir']
-        self.log4j = self.conf['artifacts']['log4j']
+        self.ic_test_dir = self.cfg.ic_test_dir
+        self.ic_data_dir = self.cfg.ic_data_dir
+        self.ic_log_dir = self.cfg.ic_log_dir
+        self.log4j = self.topo.artifacts.log4j
         self.log4j_remote = self.cwd + '/log4j.properties'
+        self.peer_seeding = self.topo.artifacts.peer_seeding
 
+    # cmd is a single command or a dict of per-node commands, run on all nodes at once
     def run_on_all(self, cmd):
-        for nid in self.nodes:
-            self.ssh.execute(self.nodes.get(nid), cmd)
+        return self.ssh.execute_all(self.nodes, cmd)
 
     def setup(self):
         # create dirs
@@ -44,8 +48,11 @@ class ServerContainer:
 
     # for forcing the use of specific ip, add ip address to use under nodes in config file
     # and then set use_ic_ip to True
-    def start(self, sys_props=" -Dzookeeper.digest.enabled=false ", use_ic_ip=False):
-        for nid in self.nodes:
+    # nids: start containers on these nodes only, all nodes if None
+    def start(self, sys_props=" -Dzookeeper.digest.enabled=false ", use_ic_ip=False, nids=None):
+        nodes = self.nodes if nids is None else {nid: self.nodes[nid] for nid in nids}
+        cmds = dict()
+        for nid in nodes:
             ic_ip = ' '
             if use_ic_ip:
                 ic_ip = " -Dtest.ic.ip=" + self.nodes.get(nid).hostname
@@ -54,47 +61,62 @@ class ServerContainer:
                    + ic_ip
                    + " -Dzookeeper.4lw.commands.whitelist=* "
                    + " -Dzookeeper.log.dir=" + self.cwd
+                   + gc_log_opt(self.cwd)
                    + " -Dlog4j.configuration=file:" + self.log4j_remote
                    + " -Dtest.data.dir=" + self.ic_test_dir
                    + " -DsnapDir=" + self.ic_data_dir + " -DlogDir=" + self.ic_log_dir
                    + " -jar " + self.jar_remote + " ic " + "sic-" + str(nid) + " "
                    + self.registry + ":" + str(self.registry_port)
-                   + " /generateLoad &")
-            self.ssh.execute(self.nodes.get(nid), cmd)
+                   + " /generateLoad")
+            cmds[nid] = cmd
+        self.ssh.spawn_all(nodes, cmds, {nid: self.pid_file(nid) for nid in nodes},
+                           {nid: self.log_file(nid) for nid in nodes})
+
+    def pid_file(self, nid):
+        return self.cwd + '/sic-' + str(nid) + '.pid'
+
+    # stdout and stderr of the container
+    def log_file(self, nid):
+        return self.cwd + '/sic-' + str(nid) + '.out'
+
+    def stop_cmds(self):
+        return {nid: kill_cmd(self.pid_file(nid), self.jar_remote, " | grep sic-") for nid in self.nodes}
 
     def stop(self):
-        cmd = ("ps aux | grep -v grep | grep " + self.jar_remote
-               + " | grep sic- | awk '{print $2}' | xargs kill -9")
-        self.run_on_all(cmd)
+        self.run_on_all(self.stop_cmds())
+
+    # ports: {nid: client ports of the zookeeper servers under test in that container}
+    def ports_free_cmds(self, ports):
+        return {nid: ports_free_cmd(p) for nid, p in ports.items()}
+
+    def del_data_cmd(self):
+        return ("rm -rf " + self.ic_log_dir.strip() + "/* "
+                + self.ic_data_dir.strip() + "/* "
+                + self.ic_test_dir.strip() + "/*")
 
     # delete zk server instance container data
     def del_sic_data(self):
-        self.run_on_all("rm -rf " + self.ic_log_dir.strip() + "/*")
-        self.run_on_all("rm -rf " + self.ic_data_dir.strip() + "/*")
-        self.run_on_all("rm -rf " + self.ic_test_dir.strip() + "/*")
+        self.run_on_all(self.del_data_cmd())
+
+    def destroy_cmd(self):
+        return ("rm -rf " + self.ic_log_dir + " " + self.ic_data_dir + " "
+                + self.ic_test_dir + " " + self.cwd)
 
     def destroy(self):
         # delete zookeeper data directory
-        self.run_on_all("rm -rf " + self.ic_log_dir)
-        self.run_on_all("rm -rf " + self.ic_data_dir)
-        self.run_on_all("rm -rf " + self.ic_test_dir)
-        self.run_on_all("rm -rf " + self.cwd)
+        self.run_on_all(self.destroy_cmd())
         # close all active ssh connections
         # self.close_all_cnxs()
 
     def create_dirs(self):
-        self.run_on_all("mkdir -p " + self.cwd)
-        self.run_on_all("mkdir -p " + self.ic_test_dir)
-        self.run_on_all("mkdir -p " + self.ic_data_dir)
-        self.run_on_all("mkdir -p " + self.ic_log_dir)
+        self.run_on_all("mkdir -p " + self.cwd + " " + self.ic_test_dir + " "
+                        + self.ic_data_dir + " " + self.ic_log_dir)
 
     def put_jar(self):
-        for nid in self.nodes:
-            self.ssh.put(self.nodes.get(nid), self.jar, self.jar_remote)
+        self.sync.push(self.nodes, self.jar, self.jar_remote, self.peer_seeding)
 
     def put_log4j(self):
-        for nid in self.nodes:
-            self.ssh.put(self.nodes.get(nid), self.log4j, self.log4j_remote)
+        self.sync.push(self.nodes, self.log4j, self.log4j_remote)
 
     def close_all_cnxs(self):
         for nid in self.nodes:
@@ -103,27 +125,28 @@ class ServerContainer:
 
 class ClientContainer:
 
-    def __init__(self):
+    # topo: cluster topology, the default one from config.yml if not given
+    def __init__(self, topo: Topology = None):
         self.ssh = SshClient()
-        self.cfg = {}
-        with open('config.yml', 'r') as f:
-            self.conf = yaml.load(f, Loader=yaml.FullLoader)
-            self.cfg = self.conf['client-containers']
-            self.registry = list(self.conf['registry']['nodes'].values())[0]
-            self.registry_port = self.conf['registry']['clientPort']
+        self.sync = ArtifactSync()
+        self.topo = topo if topo is not None else load_config()
+        self.cfg = self.topo.client_containers
+        self.registry = self.topo.registry_host
+        self.registry_port = self.topo.registry.client_port
         self.nodes = dict()
-        for nid in self.cfg['nodes']:
-            self.nodes[nid] = Node(self.cfg['nodes'][nid], str(self.cfg['user']),
-                                   self.cfg['passwd'], self.cfg['passwordLess'])
-        self.cwd = self.cfg['cwd-prefix']
-        self.jar = self.conf['artifacts']['fat-jar']
+        for nid in self.cfg.nodes:
+            self.nodes[nid] = Node(self.cfg.nodes[nid], self.cfg.user,
+                                   self.cfg.passwd, self.cfg.passwd_less)
+        self.cwd = self.cfg.cwd
+        self.jar = self.topo.artifacts.fat_jar
         self.jar_remote = self.cwd + '/' + self.jar.split('/')[-1]
-        self.log4j = self.conf['artifacts']['log4j']
+        self.log4j = self.topo.artifacts.log4j
         self.log4j_remote = self.cwd + '/log4j.properties'
+        self.peer_seeding = self.topo.artifacts.peer_seeding
 
+    # cmd is a single command or a dict of per-node commands, run on all nodes at once
     def run_on_all(self, cmd):
-        for nid in self.nodes:
-            self.ssh.execute(self.nodes.get(nid), cmd)
+        return self.ssh.execute_all(self.nodes, cmd)
 
     def setup(self):
         # create dirs
@@ -133,34 +156,49 @@ class ClientContainer:
         # copy log4j file
         self.put_log4j()
 
-    def start(self, sys_props=''):
-        for nid in self.nodes:
+    # nids: start containers on these nodes only, all nodes if None
+    def start(self, sys_props='', nids=None):
+        nodes = self.nodes if nids is None else {nid: self.nodes[nid] for nid in nids}
+        cmds = dict()
+        for nid in nodes:
             cmd = ("java " + sys_props
                    + " -Dzookeeper.log.dir=" + self.cwd
+                   + gc_log_opt(self.cwd)
                    + " -Dlog4j.configuration=file:" + self.log4j_remote
                    + " -jar " + self.jar_remote + " ic " + " cic-" + str(nid) + " "
                    + self.registry + ":" + str(self.registry_port)
-                   + " /generateLoad &")
-            self.ssh.execute(self.nodes.get(nid), cmd)
+                   + " /generateLoad")
+            cmds[nid] = cmd
+        self.ssh.spawn_all(nodes, cmds, {nid: self.pid_file(nid) for nid in nodes},
+                           {nid: self.log_file(nid) for nid in nodes})
+
+    def pid_file(self, nid):
+        return self.cwd + '/cic-' + str(nid) + '.pid'
+
+    # stdout and stderr of the container
+    def log_file(self, nid):
+        return self.cwd + '/cic-' + str(nid) + '.out'
+
+    def stop_cmds(self):
+        return {nid: kill_cmd(self.pid_file(nid), self.jar_remote, " | grep cic-") for nid in self.nodes}
 
     def stop(self):
-        cmd = ("ps aux | grep -v grep | grep " + self.jar_remote
-               + " | grep cic- | awk '{print $2}' | xargs kill -9")
-        self.run_on_all(cmd)
+        self.run_on_all(self.stop_cmds())
+
+    def destroy_cmd(self):
+        return "rm -rf " + self.cwd
 
     def destroy(self):
-        self.run_on_all("rm -rf " + self.cwd)
+        self.run_on_all(self.destroy_cmd())
 
     def create_dirs(self):
         self.run_on_all("mkdir -p " + self.cwd)
 
     def put_jar(self):
-        for nid in self.nodes:
-            self.ssh.put(self.nodes.get(nid), self.jar, self.jar_remote)
+        self.sync.push(self.nodes, self.jar, self.jar_remote, self.peer_seeding)
 
     def put_log4j(self):
-        for nid in self.nodes:
-            self.ssh.put(self.nodes.get(nid), self.log4j, self.log4j_remote)
+        self.sync.push(self.nodes, self.log4j, self.log4j_remote)
 
     def close_all_cnxs(self):
         for nid in self.nodes:
@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from artifacts import ArtifactSync
+from cluster import Cluster
+from config import load_config
+from ingest import Store, read_samples, to_columns
+from report import group_results
+from scheduler import partition
+from ssh_client import SshClient, Node, use_backend
+
+LOG = logging.getLogger('root')
+
+BENCHES = ('connect', 'fanout', 'upload', 'push-noop', 'lifecycle', 'parse', 'ingest', 'load', 'aggregate')
+
+
+# wall times (seconds) of repeat calls of fn, setup running untimed before each
+def timeit(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return times
+
+
+# opened: ssh connections opened while timing, None where nothing goes over ssh
+def summary(bench, n, times, opened=None):
+    return dict(bench=bench, n=n, runs=len(times), min=min(times), median=statistics.median(times),
+                mean=statistics.mean(times), max=max(times), opened=opened)
+
+
+# measures the harness itself, not zookeeper: command fan-out, uploads, cluster
+# lifecycle steps per node count and bench file parsing/aggregation. Everything
+# runs on this machine (local backend) unless ssh_host is given, in which case
+# the connection, fan-out and upload benchmarks address n copies of that host
+class HarnessBench:
+
+    def __init__(self, work: str, bench_data, ssh_host=None, user=None, jar_mb=16, repeat=5):
+        self.work = work
+        self.bench_data = bench_data
+        self.ssh_host = ssh_host
+        self.user = user
+        self.repeat = repeat
+        self.jar = os.path.join(work, 'fat.jar')
+        with open(self.jar, 'wb') as f:
+            f.write(os.urandom(jar_mb << 20))
+
+    def _nodes(self, n):
+        if self.ssh_host is None:
+            use_backend('local')
+            return {nid: Node('localhost', '', '', True) for nid in range(1, n + 1)}
+        use_backend('ssh')
+        return {nid: Node(self.ssh_host, self.user, '', True) for nid in range(1, n + 1)}
+
+    def _measure(self, bench, n, fn, setup=None):
+        before = SshClient.opened
+        times = timeit(fn, self.repeat, setup)
+        return summary(bench, n, times, None if self.ssh_host is None else SshClient.opened - before)
+
+    def connect(self, n):
+        nodes = self._nodes(n)
+        ssh = SshClient()
+        return [self._measure('connect', n, lambda: ssh.execute_all(nodes, 'true', quiet=True), ssh.close_all)]
+
+    def fanout(self, n):
+        nodes = self._nodes(n)
+        ssh = SshClient()
+        ssh.execute_all(nodes, 'true', quiet=True)
+        return [self._measure('fanout', n, lambda: ssh.execute_all(nodes, 'true', quiet=True))]
+
+    # every node gets its own destination, so nodes on one host all copy
+    def upload(self, n):
+        nodes = self._nodes(n)
+        ssh = SshClient()
+        dst = '/tmp/harness-bench-' + str(os.getpid())
+        ssh.execute_all(nodes, 'mkdir -p ' + dst, quiet=True)
+        res = self._measure('upload', n, lambda: ssh.map_nodes(
+            nodes, lambda nid, node: ssh.put(node, self.jar, dst + '/' + str(nid) + '.jar')))
+        ssh.execute_all(nodes, 'rm -rf ' + dst, quiet=True)
+        return [res]
+
+    # the common case at every run_test: all remote copies already up to date
+    def push_noop(self, n):
+        nodes = self._nodes(n)
+        dst = '/tmp/harness-bench-' + str(os.getpid()) + '.jar'
+        sync = ArtifactSync()
+        sync.push(nodes, self.jar, dst)
+        res = self._measure('push-noop', n, lambda: sync.push(nodes, self.jar, dst))
+        SshClient().execute_all(nodes, 'rm -f ' + dst, quiet=True)
+        return [res]
+
+    # setup, stop, del_data and destroy of n local cluster slots run at once, as
+    # the Scheduler does. Every slot has one node per role on hosts of its own
+    # (made-up names, the local backend runs everything here) and its own working
+    # dirs, so no two nodes share a copy or a teardown script. Nothing is started,
+    # so stop measures the teardown scripts alone
+    def lifecycle(self, n):
+        root = os.path.join(self.work, 'cluster')
+        hosts = '[' + ', '.join('slot' + str(s) + '-' + r for s in range(n)
+                                for r in ('reg', 'sic', 'cic', 'lm')) + ']'
+        topo = load_config('config.yml', 'local', (
+            'scheduler.hosts=' + hosts, 'scheduler.slots=' + str(n),
+            'scheduler.slot-shape={registry: 1, server-containers: 1, client-containers: 1, load-manager: 1}',
+            'registry.cwd-prefix=' + root + '/reg', 'server-containers.cwd-prefix=' + root + '/sic',
+            'server-containers.icTestDir=' + root + '/sic-test', 'server-containers.icDataDir=' + root + '/sic-snap',
+            'server-containers.icDataLogDir=' + root + '/sic-txn', 'client-containers.cwd-prefix=' + root + '/cic',
+            'load-manager.cwd=' + root + '/ctrl', 'paths.bench-data=' + root + '/bench-data',
+            'artifacts.fat-jar=' + self.jar))
+        clusters = [Cluster(t) for t in partition(topo, n)]
+
+        def each(step):
+            threads = [threading.Thread(target=getattr(c, step)) for c in clusters]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        times = dict(setup=[], stop=[], del_data=[], destroy=[])
+        for _ in range(self.repeat):
+            for step in ('setup', 'stop', 'del_data', 'destroy'):
+                times[step] += timeit(lambda: each(step), 1)
+        return [summary(step, n, t) for step, t in times.items()]
+
+    def _files(self):
+        return [os.path.join(d, f) for root in self.bench_data for d, _, files in os.walk(root)
+                for f in sorted(files)]
+
+    def parse(self):
+        files = self._files()
+
+        def run():
+            for path in files:
+                rows, _ = read_samples(path)
+                if rows:
+                    to_columns(rows)
+
+        return [self._measure('parse', len(files), run)]
+
+    def ingest(self):
+        store = os.path.join(self.work, 'store')
+        files = len(self._files())
+        return [self._measure('ingest', files, lambda: Store(store).ingest_dirs(self.bench_data),
+                              lambda: shutil.rmtree(store, ignore_errors=True))]
+
+    def load(self):
+        store = Store(os.path.join(self.work, 'store'))
+        store.ingest_dirs(self.bench_data)
+
+        def run():
+            for run_id, _ in store.runs():
+                store.load(run_id)['tput'].sum()
+
+        return [self._measure('load', len(store.index), run)]
+
+    # steady-state statistics of every test point, from scratch
+    def aggregate(self):
+        store = Store(os.path.join(self.work, 'store'))
+        store.ingest_dirs(self.bench_data)
+        cache = os.path.join(self.work, 'groups.json')
+        return [self._measure('aggregate', len(store.index), lambda: group_results(store, cache),
+                              lambda: os.path.exists(cache) and os.remove(cache))]
+
+    # node count benchmarks run once per count, the bench file ones once
+    def run(self, benches, node_counts):
+        res = []
+        for b in benches:
+            fn = getattr(self, b.replace('-', '_'))
+            if b in ('parse', 'ingest', 'load', 'aggregate'):
+                res += fn()
+            else:
+                for n in node_counts:
+                    res += fn(n)
+        return res
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# last recorded result per (bench, n) in the results file
+def previous(path):
+    prev = dict()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                for r in json.loads(line)['results']:
+                    prev[(r['bench'], r['n'])] = r
+    return prev
+
+
+def print_table(results, prev, out=sys.stdout):
+    out.write("%-10s %5s %5s %10s %10s %10s %6s %9s\n"
+              % ('bench', 'n', 'runs', 'min ms', 'median ms', 'max ms', 'conns', 'vs last'))
+    for r in results:
+        p = prev.get((r['bench'], r['n']))
+        change = '' if p is None else "%+8.1f%%" % (100.0 * (r['median'] - p['median']) / p['median'])
+        out.write("%-10s %5d %5d %10.1f %10.1f %10.1f %6s %9s\n"
+                  % (r['bench'], r['n'], r['runs'], 1000 * r['min'], 1000 * r['median'], 1000 * r['max'],
+                     'n/a' if r.get('opened') is None else r['opened'], change))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="benchmark the harness itself on this machine and append the results to a "
+                    "results file, printing the change of each median against the last recorded run")
+    parser.add_argument('benches', nargs='*', default=list(BENCHES), metavar='BENCH',
+                        help="any of " + ', '.join(BENCHES) + " (default: all)")
+    parser.add_argument('-n', '--nodes', nargs='+', type=int, default=[1, 4, 16], help="node counts")
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--bench-data', nargs='+', default=['../bench-data'])
+    parser.add_argument('--jar-mb', type=int, default=16, help="size of the uploaded stand-in jar")
+    parser.add_argument('--ssh-host', help="run connect, fanout and upload against this host over ssh")
+    parser.add_argument('--user', default=os.environ.get('USER'), help="ssh user for --ssh-host")
+    parser.add_argument('--out', default='../harness-bench.jsonl', help="results file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log harness activity")
+    args = parser.parse_args()
+    unknown = set(args.benches) - set(BENCHES)
+    if unknown:
+        parser.error("unknown benchmarks: " + ', '.join(sorted(unknown)))
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s: %(message)s")
+
+    work = tempfile.mkdtemp(prefix='harness-bench-')
+    try:
+        hb = HarnessBench(work, args.bench_data, args.ssh_host, args.user, args.jar_mb, args.repeat)
+        results = hb.run(args.benches, args.nodes)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    print_table(results, previous(args.out))
+    with open(args.out, 'a') as f:
+        f.write(json.dumps(dict(ts=time.strftime('%Y-%m-%dT%H:%M:%S'), commit=_commit(), host=platform.node(),
+                                python=platform.python_version(), repeat=args.repeat,
+                                ssh_host=args.ssh_host, results=results), sort_keys=True) + '\n')
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+from ssh_client import SshClient
+
+LOG = logging.getLogger('root')
+
+# files of a working dir kept after each run: zookeeper logs (zookeeper.log.dir
+# is the working dir), console output of the jvms, config snapshots and gc logs;
+# the load manager's dir adds the bench output and load file of the run (earlier
+# runs' bench files stay there and were archived with their own run)
+PATTERNS = ('*.log', '*.log.*', '*.out', '*.cfg', '*.cfg.*', '*.properties', 'gc*')
+
+
+# jvm option writing the gc log of the jvm into its working dir, one file per
+# pid as containers may share a working dir; picked up by the gc* pattern
+def gc_log_opt(cwd: str):
+    return " '-Xlog:gc*:file=" + cwd + "/gc-%p.log:time,uptime' "
+
+
+_ZSTD = b'\x28\xb5\x2f\xfd'
+
+
+# tars the matching files of cwd to stdout, compressed with zstd where installed
+# and gzip otherwise; "<size> <name>" of every file goes to stderr for the
+# manifest, followed by "= <size>" of the whole archive. The archive is built
+# in a remote temp file first, so that a failing find, tar or compressor fails
+# the command instead of leaving a truncated archive behind. tar exits with 1
+# for logs that grew while it read them, which is expected of running servers
+def archive_cmd(cwd: str, patterns=PATTERNS):
+    sel = ("find . -maxdepth 1 -type f \\( "
+           + " -o ".join("-name '" + p + "'" for p in patterns) + " \\)")
+    return ("set -o pipefail; cd " + cwd + " || exit 1; a=$(mktemp) || exit 1; "
+            + sel + " -printf '%s %P\\n' >&2; "
+            + "{ " + sel + " -print0 | { tar --null -T - -cf -; [ $? -le 1 ]; } |"
+            + " if command -v zstd >/dev/null; then zstd -q -3 -c; else gzip -1 -c; fi; } > $a"
+            + " || { rm -f $a; exit 1; }; "
+            + "echo \"= $(wc -c < $a)\" >&2; cat $a; rc=$?; rm -f $a; exit $rc")
+
+
+# {label: (node, cwd, patterns)} of every working dir of the cluster for the run
+# of test point name; instances sharing a host and working dir (several
+# containers on one machine) are archived once
+def targets(cluster, name: str):
+    lm = PATTERNS + ('bench.' + name, os.path.basename(cluster.lm.load_data_file))
+    res = dict()
+    seen = dict()
+    for role, comp in (('reg', cluster.reg), ('sic', cluster.sic), ('cic', cluster.cic)):
+        for nid, node in comp.nodes.items():
+            if (node.hostname, comp.cwd) not in seen:
+                seen[(node.hostname, comp.cwd)] = role + '-' + str(nid)
+                res[role + '-' + str(nid)] = (node, comp.cwd, PATTERNS)
+    shared = seen.get((cluster.lm.host.hostname, cluster.lm.cwd))
+    if shared is None:
+        res['lm'] = (cluster.lm.host, cluster.lm.cwd, lm)
+    else:
+        res[shared] = res[shared][:2] + (lm,)
+    return res
+
+
+# ({name: size} of the archived files, size of the archive or None)
+def _files(stderr: str):
+    files, size = dict(), None
+    for line in stderr.splitlines():
+        size_, _, name = line.partition(' ')
+        if size_ == '=' and name.strip().isdigit():
+            size = int(name)
+        elif size_.isdigit() and name:
+            files[name] = int(size_)
+    return files, size
+
+
+# integrity test of a fetched archive with the local zstd or gzip; None where
+# the tool is not installed here
+def _test(path: str, zstd: bool):
+    tool = 'zstd' if zstd else 'gzip'
+    if shutil.which(tool) is None:
+        return None
+    return subprocess.run([tool, '-t', '-q', path], stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+
+# pulls one compressed archive per working dir, all hosts at once, into out_dir
+# (<label>.tar.zst or .tar.gz) and describes them in out_dir/manifest.json
+class Harvester:
+
+    def __init__(self, targets: dict, timeout=600):
+        self.ssh = SshClient()
+        self.targets = targets
+        self.timeout = timeout
+
+    # an archive is kept only if it arrived whole: the size the remote side
+    # reported, and a passing zstd/gzip -t where that tool is installed here
+    def _fetch(self, label, node, out_dir):
+        _, cwd, patterns = self.targets[label]
+        tmp = os.path.join(out_dir, label + '.tar.part')
+        with open(tmp, 'wb') as f:
+            r = self.ssh.execute(node, archive_cmd(cwd, patterns), self.timeout, quiet=True, sink=f)
+        files, size = _files(r.stderr)
+        entry = dict(label=label, host=node.hostname, cwd=cwd, seconds=round(r.elapsed, 3), files=files)
+        if not r.ok:
+            os.remove(tmp)
+            entry['error'] = str(r.error) if r.error is not None else r.stderr.strip()[-500:]
+            return entry
+        got = os.path.getsize(tmp)
+        with open(tmp, 'rb') as f:
+            zstd = f.read(4) == _ZSTD
+        entry['verified'] = _test(tmp, zstd)
+        if got != size or entry['verified'] is False:
+            os.remove(tmp)
+            entry['error'] = ("archive of " + str(got) + " bytes, " + str(size) + " sent"
+                              + ("" if entry['verified'] is None else ", integrity test "
+                                 + ("passed" if entry['verified'] else "failed")))
+            return entry
+        entry['archive'] = label + ('.tar.zst' if zstd else '.tar.gz')
+        os.replace(tmp, os.path.join(out_dir, entry['archive']))
+        entry['bytes'] = got
+        return entry
+
+    # returns the manifest; hosts that failed are listed in it with their error
+    def collect(self, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        started = time.monotonic()
+        res = self.ssh.map_nodes({label: t[0] for label, t in self.targets.items()},
+                                 lambda label, node: self._fetch(label, node, out_dir))
+        entries = []
+        for label, e in sorted(res.items()):
+            if isinstance(e, Exception):
+                e = dict(label=label, host=self.targets[label][0].hostname, cwd=self.targets[label][1],
+                         error=str(e))
+            entries.append(e)
+        raw = sum(sum(e.get('files', {}).values()) for e in entries)
+        packed = sum(e.get('bytes', 0) for e in entries)
+        manifest = dict(created=time.strftime('%Y-%m-%dT%H:%M:%S'), seconds=round(time.monotonic() - started, 3),
+                        raw_bytes=raw, bytes=packed, archives=entries)
+        with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        failed = [e['label'] for e in entries if 'error' in e]
+        if failed:
+            LOG.warning("harvest: failed on %s", ', '.join(failed))
+        LOG.info("harvest: %d archives, %d bytes (%d uncompressed) in %.1fs into %s",
+                 len(entries) - len(failed), packed, raw, manifest['seconds'], out_dir)
+        return manifest
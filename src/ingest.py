@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+
+import numpy as np
+
+LOG = logging.getLogger('root')
+
+# bench file names as written by run_test / get_bench_data, e.g.
+#   SHA-512_PD-True_4096B_20210420084644     (bench-data/)
+#   NA_1024KiB_20210322013636                (bench-data/)
+#   20210313032749.SHA-256_PD-True_1024KiB   (res/)
+#   SHA_PD-True_32B_spiky-s0_20210420084644  (load profile runs are tagged)
+_TEST = (r'(?P<algo>[A-Za-z0-9-]+?)(?:_PD-(?P<pd>True|False))?_(?P<size>\d+)(?P<unit>B|KiB)'
+         r'(?:_(?P<tag>[A-Za-z0-9-]+))?')
+_NAME_TS = re.compile('^' + _TEST + r'_(?P<ts>\d{14})$')
+_TS_NAME = re.compile(r'^(?P<ts>\d{14})\.' + _TEST + '$')
+
+# one load generator sample: seq H:M:S pct% throughput min mean max
+_LINE = re.compile(r'^(\d+) (\d+):(\d+):(\d+) (\d+)% (\d+) (\d+) ([0-9.eE+-]+) (\d+)$')
+
+COLUMNS = ('seq', 't', 'pct', 'tput', 'min', 'mean', 'max')
+DTYPES = dict(seq=np.uint32, t=np.uint32, pct=np.uint8, tput=np.uint32,
+              min=np.uint32, mean=np.float64, max=np.uint32)
+
+# run file: magic, header length, json run metadata padded with spaces to the
+# header length, then packed little-endian records of RECORD until the end
+MAGIC = b'ZKB1'
+RECORD = np.dtype([(c, np.dtype(DTYPES[c]).newbyteorder('<')) for c in COLUMNS])
+_HEADER = 256
+# bytes at either end of the parsed part of a source file that identify it
+_PROBE = 4096
+
+
+# reqsz is in bytes: older runs are labelled KiB but passed the same number
+# to generateLoad as its request size in bytes (see run.py.lat)
+def parse_name(path: str):
+    name = os.path.basename(path)
+    m = _NAME_TS.match(name) or _TS_NAME.match(name)
+    if m is None:
+        return None
+    pd = m.group('pd')
+    return dict(algo=m.group('algo'),
+                pd=None if pd is None else pd == 'True',
+                reqsz=int(m.group('size')),
+                tag=m.group('tag'),
+                ts=m.group('ts'))
+
+
+# yields (seq, secs_of_day, pct, tput, min, mean, max) for every complete sample
+# line; garbage and a partially written trailing line are skipped
+def parse_lines(lines):
+    for line in lines:
+        if not line.endswith('\n'):
+            return
+        m = _LINE.match(line.strip())
+        if m is None:
+            continue
+        g = m.groups()
+        yield (int(g[0]), int(g[1]) * 3600 + int(g[2]) * 60 + int(g[3]), int(g[4]),
+               int(g[5]), int(g[6]), float(g[7]), int(g[8]))
+
+
+# digest of the first and last _PROBE bytes before offset: a file that only grew
+# keeps it, one rewritten in place (a rerun under the same name) almost surely not
+def fingerprint(path: str, offset: int):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        h.update(f.read(min(offset, _PROBE)))
+        f.seek(max(0, offset - _PROBE))
+        h.update(f.read(offset - f.tell()))
+    return h.hexdigest()
+
+
+# reads samples starting at byte offset; returns (rows, offset after the last complete line)
+def read_samples(path: str, offset=0):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    rows = list(parse_lines(data[:end].decode(errors='replace').splitlines(True)))
+    return rows, offset + end
+
+
+# bench lines only carry the wall clock time of day; turn it into seconds since
+# the first sample (start), continuing from the previous elapsed value when a
+# file is parsed incrementally and allowing for runs that cross midnight
+def elapsed(secs_of_day, start=None, last=0):
+    t = np.asarray(secs_of_day, dtype=np.int64)
+    if t.size == 0:
+        return t, start, last
+    if start is None:
+        start = int(t[0])
+    rel = (t - start) % 86400
+    steps = np.diff(np.concatenate(([last % 86400], rel))) % 86400
+    out = last + np.cumsum(steps)
+    return out, start, int(out[-1])
+
+
+def to_columns(rows, start=None, last=0):
+    arr = np.array(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+    t, start, last = elapsed(arr[:, 1], start, last)
+    cols = dict()
+    for i, c in enumerate(COLUMNS):
+        cols[c] = (t if c == 't' else arr[:, i]).astype(DTYPES[c])
+    return cols, start, last
+
+
+def write_run(path: str, meta: dict, cols: dict):
+    head = json.dumps(meta, sort_keys=True).encode()
+    size = max(_HEADER, -(-(len(head) + 8) // 64) * 64)
+    rec = np.empty(cols['seq'].size, dtype=RECORD)
+    for c in COLUMNS:
+        rec[c] = cols[c]
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + np.uint32(size).tobytes() + head.ljust(size - 8))
+        f.write(rec.tobytes())
+    os.replace(tmp, path)
+
+
+# appends after the first rows records, dropping whatever an earlier append
+# left behind that never made it into the index (a crash before save_index)
+def append_run(path: str, cols: dict, rows: int):
+    rec = np.empty(cols['seq'].size, dtype=RECORD)
+    for c in COLUMNS:
+        rec[c] = cols[c]
+    with open(path, 'r+b') as f:
+        end = _header_size(f, path) + rows * RECORD.itemsize
+        if os.fstat(f.fileno()).st_size < end:
+            raise ValueError(path + ": fewer than " + str(rows) + " records")
+        f.truncate(end)
+        f.seek(end)
+        f.write(rec.tobytes())
+
+
+def _header_size(f, path: str):
+    if f.read(4) != MAGIC:
+        raise ValueError(path + ": not a run file")
+    return int(np.frombuffer(f.read(4), dtype='<u4')[0])
+
+
+# (metadata, records) of a run file; records are a read-only memory map, so
+# fields and slices of it are views that only page in what is touched
+def open_run(path: str):
+    with open(path, 'rb') as f:
+        size = _header_size(f, path)
+        meta = json.loads(f.read(size - 8).decode())
+    n = (os.path.getsize(path) - size) // RECORD.itemsize
+    if n == 0:
+        return meta, np.zeros(0, dtype=RECORD)
+    return meta, np.memmap(path, dtype=RECORD, mode='r', offset=size, shape=(n,))
+
+
+# [(pct, records)] per phase, records being views into rec
+def phase_slices(rec):
+    pct = rec['pct']
+    if pct.size == 0:
+        return []
+    bounds = np.concatenate(([0], np.flatnonzero(pct[1:] != pct[:-1]) + 1, [pct.size]))
+    return [(int(pct[s]), rec[s:e]) for s, e in zip(bounds[:-1], bounds[1:])]
+
+
+# columnar store of parsed bench runs: one run file (see write_run) per run plus
+# index.json with run metadata and how far into the source file we have parsed
+class Store:
+
+    def __init__(self, root: str):
+        self.root = root
+        self.index_file = os.path.join(root, 'index.json')
+        self.index = dict()
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+
+    def _data_file(self, run_id: str):
+        return os.path.join(self.root, run_id.replace('/', '__') + '.zkb')
+
+    def save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.index_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.index_file)
+
+    # columns are views into the memory mapped run file
+    def load(self, run_id: str):
+        rec = self.records(run_id)
+        return {c: rec[c] for c in COLUMNS}
+
+    def records(self, run_id: str):
+        return open_run(self._data_file(run_id))[1]
+
+    # parse new or changed files; a file that only grew (same size or more, same
+    # fingerprint of the part parsed so far) is parsed from where we left off
+    def ingest(self, path: str, run_id: str):
+        meta = parse_name(path)
+        if meta is None:
+            return False
+        st = os.stat(path)
+        entry = self.index.get(run_id)
+        data = self._data_file(run_id)
+        # entries of stores written before the run file format are parsed again
+        if not os.path.exists(data):
+            entry = None
+            old = os.path.splitext(data)[0] + '.npz'
+            if os.path.exists(old):
+                os.remove(old)
+        if entry is not None and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return False
+
+        grown = (entry is not None and st.st_size >= entry['offset']
+                 and entry.get('fingerprint') == fingerprint(path, entry['offset'])
+                 and open_run(data)[1].size >= entry['rows'])
+        offset, start, last = 0, None, 0
+        if grown:
+            offset, start, last = entry['offset'], entry['start'], entry['last']
+        rows, offset = read_samples(path, offset)
+        cols, start, last = to_columns(rows, start, last)
+
+        os.makedirs(self.root, exist_ok=True)
+        if grown:
+            append_run(data, cols, entry['rows'])
+            n = entry['rows'] + int(cols['seq'].size)
+        else:
+            write_run(data, dict(meta, src=path, start=start), cols)
+            n = int(cols['seq'].size)
+        meta.update(src=path, mtime=st.st_mtime_ns, size=st.st_size, offset=offset,
+                    fingerprint=fingerprint(path, offset), start=start, last=last, rows=n)
+        self.index[run_id] = meta
+        return True
+
+    def ingest_dirs(self, roots):
+        n = 0
+        for root in roots:
+            for d, _, files in os.walk(root):
+                for name in sorted(files):
+                    path = os.path.join(d, name)
+                    run_id = os.path.relpath(path, os.path.dirname(os.path.abspath(root)))
+                    if self.ingest(path, run_id):
+                        n += 1
+        self.save_index()
+        LOG.info("ingested %d new or changed runs", n)
+        return n
+
+    def runs(self, algo=None, pd=None, reqsz=None):
+        for run_id in sorted(self.index):
+            m = self.index[run_id]
+            if algo is not None and m['algo'] != algo:
+                continue
+            if pd is not None and m['pd'] != pd:
+                continue
+            if reqsz is not None and m['reqsz'] != reqsz:
+                continue
+            yield run_id, m
+
+    # returns [(run_id, meta, columns)] restricted to samples of the given read percentage
+    def query(self, algo=None, pd=None, reqsz=None, pct=None):
+        res = []
+        for run_id, m in self.runs(algo, pd, reqsz):
+            cols = self.load(run_id)
+            if pct is not None:
+                sel = cols['pct'] == pct
+                cols = {c: v[sel] for c, v in cols.items()}
+            res.append((run_id, m, cols))
+        return res
+
+    # throughput samples per request size, e.g. throughput('SHA-256', True, 70)
+    def throughput(self, algo, pd, pct):
+        res = dict()
+        for _, m, cols in self.query(algo, pd, pct=pct):
+            res.setdefault(m['reqsz'], []).append(cols['tput'])
+        return {sz: np.concatenate(v) for sz, v in sorted(res.items())}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s: %(message)s")
+    parser = argparse.ArgumentParser(description="ingest bench output into the columnar store")
+    parser.add_argument('roots', nargs='*', default=['../bench-data', '../res'])
+    parser.add_argument('--store', default='../bench-store')
+    args = parser.parse_args()
+    store = Store(args.store)
+    store.ingest_dirs(args.roots)
+    print(len(store.index), "runs in", args.store)
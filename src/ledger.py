@@ -0,0 +1,85 @@
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+
+LOG = logging.getLogger('root')
+
+
+# append-only json-lines journal of test points, so a restarted sweep can skip
+# what was already collected; the last record for a test point wins
+class Ledger:
+
+    def __init__(self, path: str, bench_dir: str):
+        self.path = path
+        self.bench_dir = bench_dir
+        self.lock = threading.Lock()
+        self.state = dict()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # torn last line from a crash
+                    continue
+                self.state[rec['name']] = rec
+
+    def record(self, name: str, status: str, **fields):
+        rec = dict(name=name, status=status, time=datetime.datetime.now().isoformat())
+        rec.update(fields)
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(rec, sort_keys=True) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.state[name] = rec
+
+    def status(self, name: str):
+        rec = self.state.get(name)
+        return None if rec is None else rec['status']
+
+    # bench files pulled by get_bench_data are named <test point>_<timestamp>
+    def collected(self, name: str):
+        if not os.path.isdir(self.bench_dir):
+            return None
+        pat = re.compile(re.escape(name) + r'_\d{14}$')
+        found = sorted(f for f in os.listdir(self.bench_dir) if pat.match(f))
+        return os.path.join(self.bench_dir, found[-1]) if found else None
+
+    # a point is done if the ledger says so, or if it predates the ledger and
+    # its bench file is already in bench-data
+    def done(self, name: str):
+        status = self.status(name)
+        if status is None:
+            return self.collected(name) is not None
+        return status == 'done'
+
+    def pending(self, points):
+        todo = [p for p in points if not self.done(p['name'])]
+        LOG.info("ledger: %d of %d test points already collected", len(points) - len(todo), len(points))
+        return todo
+
+    # points whose last run did not end cleanly: started but never finished (the
+    # previous sweep died mid-run) or failed (run_test raised or the run went bad)
+    def unfinished(self):
+        return [n for n, rec in self.state.items() if rec['status'] in ('started', 'failed')]
+
+    # run a test point through fn (Cluster.run_test) and journal the outcome;
+    # fn returns the local bench file path, or None if the run went bad
+    def run(self, point: dict, fn):
+        params = {k: v for k, v in point.items() if k != 'name'}
+        self.record(point['name'], 'started', params=params)
+        try:
+            result = fn(**point)
+        except Exception as e:
+            self.record(point['name'], 'failed', params=params, error=str(e))
+            raise
+        self.record(point['name'], 'done' if result else 'failed', params=params, result=result)
+        return result
@@ -0,0 +1,137 @@
+import random
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+# one load generator phase: read percentage for secs seconds
+@dataclass(frozen=True, slots=True)
+class Phase:
+    pct: int
+    secs: int
+
+
+def flat(pct, secs):
+    return [Phase(pct, secs)]
+
+
+# the percentages in order, secs seconds each
+def steps(pcts, secs):
+    return [Phase(p, secs) for p in pcts]
+
+
+# linear ramp from start to end percentage in n steps spread over secs seconds;
+# the last step takes the remainder of secs not divisible by n
+def ramp(start, end, secs, n=5):
+    step = max(1, secs // n)
+    return [Phase(int(round(start + (end - start) * i / (n - 1))) if n > 1 else start,
+                  step + (max(0, secs - step * n) if i == n - 1 else 0))
+            for i in range(n)]
+
+
+# n phases with read percentages drawn from choices; seeded so a test point
+# replays the same mix when it is rerun
+def random_mix(n, secs, choices=range(0, 101, 10), seed=0):
+    rnd = random.Random(seed)
+    return [Phase(rnd.choice(list(choices)), secs) for _ in range(n)]
+
+
+# repeat times: base read percentage for base_secs, then a spike at peak (a low
+# read percentage is a write burst) for peak_secs
+def burst(base, peak, base_secs, peak_secs, repeat=1):
+    return [ph for _ in range(repeat) for ph in (Phase(base, base_secs), Phase(peak, peak_secs))]
+
+
+# phases run by one load generator invocation; client count and request size
+# are fixed per invocation, None keeps those of the test point
+@dataclass(frozen=True, slots=True)
+class Segment:
+    phases: List[Phase]
+    clients: Optional[int] = None
+    reqsz: Optional[int] = None
+
+
+@dataclass(frozen=True, slots=True)
+class Profile:
+    name: str
+    segments: List[Segment]
+    # upper bound in seconds on the summed phase durations of a segment, None for no bound
+    max_duration: Optional[int] = None
+
+    def validate(self):
+        errors = []
+        if not re.match(r'^[A-Za-z0-9]+$', self.name):
+            errors.append("name must be alphanumeric: " + self.name)
+        if not self.segments:
+            errors.append("no segments")
+        for i, seg in enumerate(self.segments):
+            where = "segment " + str(i)
+            if not seg.phases:
+                errors.append(where + ": no phases")
+            for ph in seg.phases:
+                if not isinstance(ph.pct, int) or not 0 <= ph.pct <= 100:
+                    errors.append(where + ": read percentage out of range: " + str(ph.pct))
+                if not isinstance(ph.secs, int) or ph.secs < 1:
+                    errors.append(where + ": phase must last a whole number of seconds: " + str(ph.secs))
+            for k in ('clients', 'reqsz'):
+                v = getattr(seg, k)
+                if v is not None and (not isinstance(v, int) or v < 1):
+                    errors.append(where + ": invalid " + k + ": " + str(v))
+            if self.max_duration is not None and self.duration(i) > self.max_duration:
+                errors.append(where + ": lasts " + str(self.duration(i)) + "s, more than "
+                              + str(self.max_duration) + "s")
+        if errors:
+            raise ValueError("invalid load profile " + self.name + ":\n  " + "\n  ".join(errors))
+        return self
+
+    def duration(self, segment=None):
+        segs = self.segments if segment is None else [self.segments[segment]]
+        return sum(ph.secs for seg in segs for ph in seg.phases)
+
+    # load manager commands of one segment, to go between `save` and `exit`
+    def commands(self, segment):
+        cmds = []
+        for ph in self.segments[segment].phases:
+            cmds.append("percentage " + str(ph.pct))
+            cmds.append("sleep " + str(ph.secs))
+        return cmds
+
+    # one run_test point per segment derived from point; segment runs are tagged
+    # with the profile name (and segment number) after the request size
+    def points(self, point: dict):
+        res = []
+        for i, seg in enumerate(self.segments):
+            p = dict(point)
+            if seg.clients is not None:
+                p['clients'] = seg.clients
+            if seg.reqsz is not None:
+                p['reqsz'] = seg.reqsz
+                p['name'] = re.sub(r'_\d+(B|KiB)$', '_' + str(seg.reqsz) + 'B', p['name'])
+            p['name'] += '_' + self.name + ('-s' + str(i) if len(self.segments) > 1 else '')
+            p['load'] = self.commands(i)
+            res.append(p)
+        return res
+
+
+_KINDS = dict(flat=flat, steps=steps, ramp=ramp, random=random_mix, burst=burst)
+
+
+# profile from plain data, e.g. yaml:
+#   name: spiky
+#   max-duration: 1800
+#   segments:
+#     - clients: 900
+#       phases:
+#         - [flat, 90, 120]
+#         - [burst, 90, 0, 20, 5, 6]
+#         - [ramp, 0, 100, 300, 6]
+def from_spec(spec: dict):
+    segments = []
+    for seg in spec['segments']:
+        phases = []
+        for ph in seg['phases']:
+            if ph[0] not in _KINDS:
+                raise ValueError("unknown phase kind " + str(ph[0]) + ", have: " + str(sorted(_KINDS)))
+            phases.extend(_KINDS[ph[0]](*ph[1:]))
+        segments.append(Segment(phases, seg.get('clients'), seg.get('reqsz')))
+    return Profile(spec['name'], segments, spec.get('max-duration')).validate()
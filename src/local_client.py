@@ -0,0 +1,136 @@
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+from ssh_client import SshClient, Node, Response, _Capture
+
+LOG = logging.getLogger('root')
+
+
+# runs every node's commands as subprocesses on this machine, for a whole
+# cluster on one box (topology with `backend: local`); same surface as SshClient
+class LocalClient(SshClient):
+
+    __instance = None
+
+    def __new__(cls):
+        if cls.__instance is None:
+            LOG.info("creating instance of local client...")
+            cls.__instance = object.__new__(cls)
+            cls.cnxs = dict()
+        return cls.__instance
+
+    # output goes to temp files rather than pipes: a command that backgrounds a
+    # process (`... &`) would otherwise keep the pipe open until that process exits.
+    # The files are read as they grow; see SshClient.execute for the rest
+    def execute(self, node: Node, cmd: str, timeout=None, quiet=False, on_output=None, max_output=None,
+                sink=None):
+        LOG.log(logging.DEBUG if quiet else logging.INFO, 'execute - local: %s cmd: %s', node.hostname, cmd)
+        out = _Capture('stdout', max_output or self.max_output, on_output, sink=sink)
+        err = _Capture('stderr', max_output or self.max_output, on_output)
+        timeout = self.command_timeout if timeout is None else timeout
+        started = time.monotonic()
+        with tempfile.TemporaryFile() as fo, tempfile.TemporaryFile() as fe:
+            streams = [[fo, out, 0], [fe, err, 0]]
+
+            def pump():
+                busy = False
+                for s in streams:
+                    while True:
+                        data = os.pread(s[0].fileno(), 32768, s[2])
+                        if not data:
+                            break
+                        s[1].feed(data)
+                        s[2] += len(data)
+                        busy = True
+                return busy
+
+            # own session, so that cancelling kills whatever the command started
+            p = subprocess.Popen(['bash', '-c', cmd], stdin=subprocess.DEVNULL, stdout=fo, stderr=fe,
+                                 start_new_session=True)
+            error = None
+            while p.poll() is None:
+                if time.monotonic() - started >= timeout:
+                    LOG.warning("timed out after %ss - local cmd: %s", timeout, cmd)
+                    self._kill(p)
+                    error = TimeoutError(cmd)
+                    break
+                if not pump():
+                    time.sleep(0.01)
+            pump()
+            return Response.completed(-1 if error else p.returncode, out.text(), err.text(), error,
+                                      time.monotonic() - started)
+
+    # TERM, then a second later KILL the whole process group, as SshClient does
+    @staticmethod
+    def _kill(p):
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(p.pid, sig)
+            except ProcessLookupError:
+                break
+            if sig == signal.SIGTERM:
+                time.sleep(1)
+        p.wait()
+
+    @contextmanager
+    def session(self, node: Node, cmd: str):
+        LOG.info('session - local: %s cmd: %s', node.hostname, cmd)
+        p = subprocess.Popen(['bash', '-c', cmd], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL, universal_newlines=True)
+        try:
+            yield p.stdin, _LocalStream(p)
+        finally:
+            try:
+                p.stdin.close()
+            except OSError:
+                pass
+
+    @contextmanager
+    def sftp(self, node: Node):
+        yield _LocalSftp()
+
+    def put(self, remote_host: Node, src: str, dst: str):
+        LOG.info("copy - %s to %s", src, dst)
+        shutil.copyfile(src, dst)
+
+    def get(self, remote_host: Node, src: str, dst: str):
+        LOG.info("copy - %s to %s", src, dst)
+        shutil.copyfile(src, dst)
+
+    def close(self, node: Node):
+        pass
+
+    def close_all(self):
+        pass
+
+
+# stands in for a paramiko stdout/channel pair of an interactive session
+class _LocalStream:
+
+    def __init__(self, proc):
+        self.channel = self
+        self.proc = proc
+
+    def exit_status_ready(self):
+        return self.proc.poll() is not None
+
+
+class _LocalSftp:
+
+    stat = staticmethod(os.stat)
+    open = staticmethod(open)
+
+    def get(self, src, dst):
+        shutil.copyfile(src, dst)
+
+    def put(self, src, dst):
+        shutil.copyfile(src, dst)
+
+    def close(self):
+        pass
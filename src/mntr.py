@@ -0,0 +1,184 @@
+import json
+import logging
+import re
+import socket
+import threading
+import time
+
+import numpy as np
+
+from probes import four_letter, parse_mntr
+from ssh_client import SshClient
+
+LOG = logging.getLogger('root')
+
+# mntr keys worth keeping: request latencies (avg/min/max and percentiles on
+# newer servers), queueing, data tree size, watches, connections and digest checks
+KEEP = re.compile(r'latency|outstanding|znode_count|watch_count|alive_connections|'
+                  r'packets_(received|sent)|digest')
+
+
+def scrape(host: str, port: int):
+    out = four_letter(host, port, 'mntr')
+    if 'is not executed because it is not in the whitelist' in out:
+        # srvr is whitelisted by default and carries the headline numbers
+        return parse_srvr(four_letter(host, port, 'srvr'))
+    res = dict()
+    for k, v in parse_mntr(out).items():
+        if KEEP.search(k):
+            try:
+                res[k] = float(v)
+            except ValueError:
+                pass
+    return res
+
+
+# srvr/stat: "Latency min/avg/max: 0/0.1/25", "Outstanding: 0", "Node count: 5"
+def parse_srvr(out: str):
+    res = dict()
+    for line in out.splitlines():
+        if line.startswith('Latency min/avg/max:'):
+            lo, avg, hi = line.split(':', 1)[1].strip().split('/')
+            res.update(zk_min_latency=float(lo), zk_avg_latency=float(avg), zk_max_latency=float(hi))
+        elif line.startswith('Outstanding:'):
+            res['zk_outstanding_requests'] = float(line.split(':', 1)[1])
+        elif line.startswith('Node count:'):
+            res['zk_znode_count'] = float(line.split(':', 1)[1])
+    return res
+
+
+# the zookeeper servers under test run inside the instance containers on ports
+# chosen at assignment time; each reports "<host>:<clientPort>,..." under
+# <prefix>/reports/<instance>, read here with the zookeeper cli from the fat jar
+def discover(reg, prefix='/generateLoad'):
+    node = reg.nodes.get(list(reg.nodes)[0])
+    zk = ("java -Dlog4j.configuration=file:" + reg.log4j_remote + " -cp " + reg.jar_remote
+          + " org.apache.zookeeper.ZooKeeperMain -server localhost:" + str(reg.client_port))
+    cmd = ("for r in $(" + zk + " ls " + prefix + "/reports 2>/dev/null | grep '^\\[' | tail -1 | tr -d '[],'); do"
+           + " echo \"$r $(" + zk + " get " + prefix + "/reports/$r 2>/dev/null | grep -E '^[^ ]+:[0-9]+' | tail -1)\";"
+           + " done")
+    r = SshClient().execute(node, cmd, timeout=120, quiet=True)
+    return parse_reports(r.stdout) if r.ok else dict()
+
+
+# "<instance> <report>" lines, e.g. "server0 10.1.0.11:36561,10.1.0.11:40217",
+# to {instance: (host, client port)}
+def parse_reports(out: str):
+    targets = dict()
+    for line in out.splitlines():
+        f = line.split(None, 1)
+        m = re.match(r'([\w.-]+):(\d+)', f[1]) if len(f) == 2 else None
+        if m is not None:
+            targets[f[0]] = (m.group(1), int(m.group(2)))
+    return targets
+
+
+def _addr(host: str):
+    try:
+        return socket.gethostbyname(host)
+    except OSError:
+        return host
+
+
+# {nid: client ports} of discovered servers per server container node: instances
+# are named by the load generator (server0, ...), so they are placed by the host
+# they report, compared by name and else by address; servers on a host with
+# several container nodes go to the first of them
+def ports_by_node(found: dict, nodes: dict):
+    by_name, by_addr = dict(), None
+    for nid, node in sorted(nodes.items(), reverse=True):
+        by_name[node.hostname] = nid
+    ports = dict()
+    for name, (host, port) in sorted(found.items()):
+        nid = by_name.get(host)
+        if nid is None:
+            if by_addr is None:
+                by_addr = {_addr(h): nid for h, nid in by_name.items()}
+            nid = by_addr.get(_addr(host))
+        if nid is None:
+            LOG.warning("mntr: %s reports %s:%s, not a server container host", name, host, port)
+            continue
+        ports.setdefault(nid, []).append(port)
+    return ports
+
+
+# polls mntr on the registry and on every zookeeper server under test while a
+# test point runs, appending one json line per target and poll to out
+class MntrScraper(threading.Thread):
+
+    def __init__(self, reg, out: str, interval=5, n_servers=None, discover_every=15):
+        super(MntrScraper, self).__init__(daemon=True)
+        self.reg = reg
+        self.out = out
+        self.interval = interval
+        self.n_servers = n_servers
+        self.discover_every = discover_every
+        self.targets = dict()
+        for nid in reg.nodes:
+            self.targets['registry-' + str(nid)] = (reg.nodes.get(nid).hostname, reg.client_port)
+        self.done = threading.Event()
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def _discover(self):
+        found = discover(self.reg)
+        if found:
+            self.targets.update(found)
+        return self.n_servers is not None and len(found) >= self.n_servers
+
+    def run(self):
+        complete = False
+        last_discovery = 0
+        with open(self.out, 'a') as f:
+            while not self.done.is_set():
+                started = time.time()
+                if not complete and started - last_discovery >= self.discover_every:
+                    complete = self._discover()
+                    last_discovery = started
+                for name, (host, port) in list(self.targets.items()):
+                    try:
+                        metrics = scrape(host, port)
+                    except (OSError, ValueError) as e:
+                        LOG.debug("mntr %s (%s:%s) failed: %s", name, host, port, e)
+                        continue
+                    f.write(json.dumps(dict(t=time.time(), target=name, host=host, port=port,
+                                            metrics=metrics), sort_keys=True) + '\n')
+                f.flush()
+                self.done.wait(max(0, self.interval - (time.time() - started)))
+
+
+# per target columns: t (driver epoch seconds), sod (local seconds of day, the
+# clock of bench lines) and one float array per metric, nan where missing
+def load(path: str):
+    rows = dict()
+    with open(path) as f:
+        for line in f:
+            try:
+                s = json.loads(line)
+            except ValueError:
+                continue
+            rows.setdefault(s['target'], []).append(s)
+    res = dict()
+    for target, samples in rows.items():
+        keys = sorted(set(k for s in samples for k in s['metrics']))
+        t = np.array([s['t'] for s in samples])
+        cols = dict(t=t, sod=np.array([_sod(x) for x in t]))
+        for k in keys:
+            cols[k] = np.array([s['metrics'].get(k, np.nan) for s in samples], dtype=np.float64)
+        res[target] = cols
+    return res
+
+
+def _sod(t):
+    lt = time.localtime(t)
+    return lt.tm_hour * 3600 + lt.tm_min * 60 + lt.tm_sec + (t % 1)
+
+
+# put mntr series on the elapsed-seconds axis of a stored bench run (its index
+# entry's start is the seconds of day of the first bench sample)
+def align(series: dict, start: int):
+    for cols in series.values():
+        cols['t_rel'] = (cols['sod'] - start) % 86400
+    return series
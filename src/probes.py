@@ -0,0 +1,106 @@
+import logging
+import re
+import socket
+import time
+
+from ssh_client import SshClient
+
+LOG = logging.getLogger('root')
+
+
+# send a zookeeper four letter word command and return the reply
+def four_letter(host: str, port: int, cmd: str, timeout=5):
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        s.sendall(cmd.encode())
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            data = s.recv(4096)
+            if not data:
+                break
+            chunks.append(data)
+    return b''.join(chunks).decode(errors='replace')
+
+
+def parse_mntr(out: str):
+    res = dict()
+    for line in out.splitlines():
+        kv = line.split('\t', 1)
+        if len(kv) == 2:
+            res[kv[0].strip()] = kv[1].strip()
+    return res
+
+
+def _poll(check, timeout, interval, what):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if check():
+                return
+        except (socket.error, OSError) as e:
+            LOG.debug("%s not ready yet: %s", what, e)
+        if time.monotonic() >= deadline:
+            raise TimeoutError(what + " not ready after " + str(timeout) + "s")
+        time.sleep(interval)
+
+
+# every registry node answers imok and the ensemble has elected a leader
+def wait_for_quorum(reg, timeout=120, interval=1):
+    def ready():
+        states = []
+        for nid in reg.nodes:
+            host = reg.nodes.get(nid).hostname
+            if four_letter(host, reg.client_port, 'ruok') != 'imok':
+                return False
+            states.append(parse_mntr(four_letter(host, reg.client_port, 'mntr')).get('zk_server_state'))
+        return states == ['standalone'] or states.count('leader') == 1
+
+    LOG.info("waiting for registry quorum...")
+    _poll(ready, timeout, interval, "registry quorum")
+    LOG.info("registry quorum is up")
+
+
+# instance containers register themselves with an ephemeral znode under
+# <prefix>/available; the registry leader lists ephemerals per session in `dump`
+def registered_instances(reg, prefix='/generateLoad'):
+    pat = re.compile(re.escape(prefix) + r'/available/(\S+)')
+    names = set()
+    for nid in reg.nodes:
+        out = four_letter(reg.nodes.get(nid).hostname, reg.client_port, 'dump')
+        names.update(pat.findall(out))
+    return names
+
+
+def wait_for_instances(reg, names, timeout=300, interval=2):
+    expected = set(names)
+
+    def ready():
+        missing = expected - registered_instances(reg)
+        if missing:
+            LOG.debug("waiting for instances: %s", sorted(missing))
+        return not missing
+
+    LOG.info("waiting for %d instance containers to register...", len(expected))
+    _poll(ready, timeout, interval, "instance containers")
+    LOG.info("all instance containers registered")
+
+
+def lm_running(lm):
+    cmd = ("ps aux | grep -v grep | grep " + lm.jar_remote
+           + " | grep generateLoad | wc -l")
+    r = SshClient().execute(lm.host, cmd)
+    return r.ok and r.stdout.strip() not in ('', '0')
+
+
+# wait for the load generator to run through its load file and exit, or for
+# abort() to return True; returns False if it is still running when the timeout expires
+def wait_for_lm_exit(lm, timeout, interval=5, abort=None):
+    LOG.info("waiting up to %ss for load manager to finish...", timeout)
+    try:
+        _poll(lambda: (abort is not None and abort()) or not lm_running(lm),
+              timeout, interval, "load manager exit")
+    except TimeoutError:
+        LOG.warning("load manager still running after %ss", timeout)
+        return False
+    LOG.info("load manager finished")
+    return True
@@ -0,0 +1,169 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+from collections import Counter
+
+from ssh_client import SshClient
+
+LOG = logging.getLogger('root')
+
+
+# java processes worth profiling, keyed by role: the zookeeper servers under test
+# live in the server instance containers, the registry is the bookkeeping ensemble.
+# Values are (node, cwd, pid file written at start, jar the process must run)
+def targets(cluster, roles=('sic',)):
+    res = dict()
+    if 'sic' in roles:
+        for nid, node in cluster.sic.nodes.items():
+            res['sic-' + str(nid)] = (node, cluster.sic.cwd, cluster.sic.pid_file(nid), cluster.sic.jar_remote)
+    if 'reg' in roles:
+        for nid, node in cluster.reg.nodes.items():
+            res['reg-' + str(nid)] = (node, cluster.reg.cwd, cluster.reg.pid_file, cluster.reg.jar_remote)
+    return res
+
+
+# records java flight recordings with jcmd while the load generator is in one of
+# the given percentage phases, one recording per target and phase; subscribe
+# on_sample to the live tail of the bench file to follow the phases
+class PhaseProfiler:
+
+    def __init__(self, targets: dict, name: str, pcts, out_dir: str, settings='profile'):
+        self.ssh = SshClient()
+        self.targets = targets
+        self.name = name
+        self.pcts = set(pcts)
+        self.out_dir = out_dir
+        self.settings = settings
+        self.phase = -1
+        self.pct = None
+        self.recording = None
+        # remote recordings per target: [(phase, pct, path)]
+        self.recordings = {t: [] for t in targets}
+
+    def _jcmd(self, args_of):
+        cmds = dict()
+        nodes = dict()
+        for t, (node, cwd, pid_file, jar) in self.targets.items():
+            nodes[t] = node
+            # the recorded pid, provided it still runs the jar (pids get reused)
+            cmds[t] = ("pid=$(cat " + pid_file + " 2>/dev/null | head -1);"
+                       + " test -n \"$pid\" && grep -qsF " + jar + " /proc/$pid/cmdline"
+                       + " || { echo no running process in " + pid_file + " >&2; exit 1; };"
+                       + " jcmd $pid " + args_of(t, cwd))
+        res = self.ssh.execute_all(nodes, cmds, timeout=60, quiet=True)
+        for t, r in res.items():
+            if not r.ok:
+                LOG.warning("profiler: jcmd on %s failed: %s", t, r.error or r.stderr.strip())
+        return res
+
+    def _start(self):
+        suffix = '-p' + str(self.phase) + '-pct' + str(self.pct)
+        rec = self.name + suffix
+
+        # targets sharing a host and working dir (several containers per host)
+        # must not write the same file
+        def args(t, cwd):
+            path = cwd + '/jfr/' + self.name + '-' + t + suffix + '.jfr'
+            self.recordings[t].append((self.phase, self.pct, path))
+            return ("JFR.start name=" + rec + " settings=" + self.settings + " filename=" + path)
+
+        nodes = {t: v[0] for t, v in self.targets.items()}
+        self.ssh.execute_all(nodes, {t: "mkdir -p " + v[1] + "/jfr" for t, v in self.targets.items()}, quiet=True)
+        LOG.info("profiler: recording %s on %s", rec, sorted(self.targets))
+        self._jcmd(args)
+        self.recording = rec
+
+    def _stop(self):
+        rec = self.recording
+        self.recording = None
+        self._jcmd(lambda t, cwd: "JFR.stop name=" + rec)
+
+    # sample as yielded by ingest.parse_lines, called from the live tail thread
+    def on_sample(self, sample):
+        pct = sample[2]
+        if pct == self.pct:
+            return
+        self.phase += 1
+        self.pct = pct
+        if self.recording is not None:
+            self._stop()
+        if pct in self.pcts:
+            self._start()
+
+    # stop a recording still running in the last phase and pull every recording
+    # into out_dir/<target>-p<phase>-pct<pct>.jfr; returns the local paths
+    def finish(self):
+        if self.recording is not None:
+            self._stop()
+        os.makedirs(self.out_dir, exist_ok=True)
+        pulled = []
+        for t, recs in self.recordings.items():
+            node = self.targets[t][0]
+            for phase, pct, path in recs:
+                dst = self.out_dir + '/' + t + '-p' + str(phase) + '-pct' + str(pct) + '.jfr'
+                try:
+                    self.ssh.get(node, path, dst)
+                except Exception as e:
+                    LOG.warning("profiler: failed to pull %s:%s - %s", node.hostname, path, e)
+                    continue
+                pulled.append(dst)
+        # recordings are pulled, do not let them pile up on the hosts
+        self.ssh.execute_all({t: v[0] for t, v in self.targets.items()},
+                             {t: "rm -f " + cwd + "/jfr/" + self.name + "-" + t + "-p*.jfr"
+                              for t, (_, cwd, _, _) in self.targets.items()}, quiet=True)
+        return pulled
+
+
+# `jfr print --events jdk.ExecutionSample` lists stack traces top frame first:
+#   stackTrace = [
+#     java.util.zip.CRC32.update(byte[], int, int) line: 76
+#     ...
+#   ]
+_FRAME = re.compile(r'^\s+([\w$.<>]+)\(.*?\)(?:\s+line:.*)?$')
+
+
+def collapse(text: str, prefix=()):
+    stacks = Counter()
+    frames = None
+    for line in text.splitlines():
+        s = line.strip()
+        if s.startswith('stackTrace = ['):
+            frames = []
+        elif frames is not None and s == ']':
+            if frames:
+                stacks[';'.join(list(prefix) + frames[::-1])] += 1
+            frames = None
+        elif frames is not None:
+            m = _FRAME.match(line)
+            if m is not None:
+                frames.append(m.group(1))
+    return stacks
+
+
+# fold the cpu samples of every recording in jfr_dir into one collapsed-stack file
+# (root frames are the target and phase), the input format of flamegraph.pl;
+# needs the jdk `jfr` tool on the PATH
+def collapse_dir(jfr_dir: str, out: str, stack_depth=2048):
+    jfr = shutil.which('jfr')
+    if jfr is None:
+        LOG.warning("profiler: no jfr tool on PATH, leaving %s uncollapsed", jfr_dir)
+        return None
+    total = Counter()
+    for f in sorted(os.listdir(jfr_dir)):
+        if not f.endswith('.jfr'):
+            continue
+        # jfr print cuts stacks to 5 frames unless told otherwise
+        r = subprocess.run([jfr, 'print', '--events', 'jdk.ExecutionSample', '--stack-depth', str(stack_depth),
+                            jfr_dir + '/' + f],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if r.returncode != 0:
+            LOG.warning("profiler: jfr print %s failed: %s", f, r.stderr.strip())
+            continue
+        target, phase = f[:-len('.jfr')].split('-p', 1)
+        total.update(collapse(r.stdout, (target, 'p' + phase)))
+    with open(out, 'w') as f:
+        for stack, n in sorted(total.items()):
+            f.write(stack + ' ' + str(n) + '\n')
+    return out
@@ -2,10 +2,12 @@ import datetime
 import logging
 from typing import Dict
 
-import yaml
-
+from artifacts import ArtifactSync
+from config import Topology, load_config
 from ssh_client import Node
 from ssh_client import SshClient
+from harvest import gc_log_opt
+from teardown import kill_cmd, ports_free_cmd
 
 LOG = logging.getLogger('root')
 
@@ -14,36 +16,34 @@ class ZooRegistry:
 
     nodes: Dict[int, Node]
 
-    def __init__(self):
+    # topo: cluster topology, the default one from config.yml if not given
+    def __init__(self, topo: Topology = None):
         self.ssh = SshClient()
-        self.cfg = {}
-        with open('config.yml', 'r') as f:
-            self.conf = yaml.load(f, Loader=yaml.FullLoader)
-            self.cfg = self.conf['registry']
+        self.sync = ArtifactSync()
+        self.topo = topo if topo is not None else load_config()
+        self.cfg = self.topo.registry
         self.nodes = dict()
-        for nid in self.cfg['nodes']:
-            self.nodes[nid] = Node(self.cfg['nodes'][nid], str(self.cfg['user']),
-                                   self.cfg['passwd'], self.cfg['passwordLess'])
-        # self.cwd = self.cfg['cwd-prefix'] + datetime.datetime.now().strftime('-%Y%m%d%H%M%S')
-        self.cwd = self.cfg['cwd-prefix']
-        self.jar = self.conf['artifacts']['fat-jar']
+        for nid in self.cfg.nodes:
+            self.nodes[nid] = Node(self.cfg.nodes[nid], self.cfg.user,
+                                   self.cfg.passwd, self.cfg.passwd_less)
+        # self.cwd = self.cfg.cwd + datetime.datetime.now().strftime('-%Y%m%d%H%M%S')
+        self.cwd = self.cfg.cwd
+        self.jar = self.topo.artifacts.fat_jar
         self.jar_remote = self.cwd + '/' + self.jar.split('/')[-1]
         self.zkcf_remote = self.cwd + '/' + 'zoo.cfg'
-        self.zoo_data_dir = self.cfg['dataDir']
-        # if path is relative create data dir under working directory
-        if not self.zoo_data_dir.startswith('/'):
-            self.zoo_data_dir = self.cwd + '/' + self.cfg['dataDir']
-        self.qrm_port = self.cfg['quorumPort']
-        self.ele_port = self.cfg['leaderElectionPort']
-        self.client_port = self.cfg['clientPort']
-        self.tick_time = self.cfg['tickTime']
-        self.init_limit = self.cfg['initLimit']
-        self.sync_limit = self.cfg['syncLimit']
-        self.log4j = self.conf['artifacts']['log4j']
+        self.zoo_data_dir = self.cfg.data_dir
+        self.qrm_port = self.cfg.quorum_port
+        self.ele_port = self.cfg.election_port
+        self.client_port = self.cfg.client_port
+        self.tick_time = self.cfg.tick_time
+        self.init_limit = self.cfg.init_limit
+        self.sync_limit = self.cfg.sync_limit
+        self.log4j = self.topo.artifacts.log4j
         self.log4j_remote = self.cwd + '/log4j.properties'
-        self.java_sys_props = self.cfg['java-sys-properties']
-        if self.java_sys_props is None:
-            self.java_sys_props = ''
+        self.peer_seeding = self.topo.artifacts.peer_seeding
+        self.java_sys_props = self.cfg.java_sys_props
+        # four letter words are used to probe the registry for readiness
+        self.flw_whitelist = self.cfg.flw_whitelist
 
     def get_zoo_cf(self):
         zc = str()
@@ -58,9 +58,9 @@ class ZooRegistry:
         LOG.debug("generated zoo config: {}", zc)
         return zc
 
+    # cmd is a single command or a dict of per-node commands, run on all nodes at once
     def run_on_all(self, cmd):
-        for nid in self.nodes:
-            self.ssh.execute(self.nodes.get(nid), cmd)
+        return self.ssh.execute_all(self.nodes, cmd)
 
     def setup(self):
         # create working dir
@@ -78,28 +78,45 @@ class ZooRegistry:
 
     def start(self):
         cmd = ('java ' + self.java_sys_props
+               + ' -Dzookeeper.4lw.commands.whitelist=' + self.flw_whitelist
                + ' -Dzookeeper.log.dir=' + self.cwd
+               + gc_log_opt(self.cwd)
                + ' -Dlog4j.configuration=file:' + self.log4j_remote
                + " -DsnapDir=" + self.zoo_data_dir + " -DlogDir=" + self.zoo_data_dir
                + ' -jar ' + self.jar_remote
-               + ' server ' + self.zkcf_remote + ' &')
-        self.run_on_all(cmd)
+               + ' server ' + self.zkcf_remote)
+        self.ssh.spawn_all(self.nodes, cmd, self.pid_file, self.cwd + '/registry.out')
+
+    @property
+    def pid_file(self):
+        return self.cwd + '/registry.pid'
+
+    def stop_cmd(self):
+        return kill_cmd(self.pid_file, self.jar_remote, " | grep server")
+
+    # the next run can only bind the registry ports once they are released
+    def ports_free_cmd(self):
+        return ports_free_cmd((self.client_port, self.qrm_port, self.ele_port))
 
     def stop(self):
-        cmd = "ps aux | grep -v grep | grep " + self.jar_remote + " | grep server | awk '{print $2}' | xargs kill -9"
-        self.run_on_all(cmd)
+        self.run_on_all(self.stop_cmd())
+
+    def destroy_cmd(self):
+        return "rm -rf " + self.zoo_data_dir + " " + self.cwd
 
     def destroy(self):
         # delete zookeeper data directory
-        self.run_on_all("rm -rf " + self.zoo_data_dir)
-        # delete working directory
-        self.run_on_all("rm -rf " + self.cwd)
+        # and working directory
+        self.run_on_all(self.destroy_cmd())
         # close all active ssh connections
         # self.close_all_cnxs()
 
+    def del_data_cmd(self):
+        return "rm -rf " + self.zoo_data_dir + "/version-2"
+
     # delete zk registry logs and snapshots
     def del_zkreg_data(self):
-        self.run_on_all("rm -rf " + self.zoo_data_dir + "/version-2")
+        self.run_on_all(self.del_data_cmd())
 
     def create_cwd(self):
         self.run_on_all("mkdir -p " + self.cwd)
@@ -112,17 +129,16 @@ class ZooRegistry:
         self.run_on_all(cmd)
 
     def create_myid(self):
+        cmds = dict()
         for nid in self.nodes:
-            cmd = 'echo "' + str(nid) + '" > ' + self.zoo_data_dir + '/' + 'myid'
-            self.ssh.execute(self.nodes.get(nid), cmd)
+            cmds[nid] = 'echo "' + str(nid) + '" > ' + self.zoo_data_dir + '/' + 'myid'
+        self.run_on_all(cmds)
 
     def put_jar(self):
-        for nid in self.nodes:
-            self.ssh.put(self.nodes.get(nid), self.jar, self.jar_remote)
+        self.sync.push(self.nodes, self.jar, self.jar_remote, self.peer_seeding)
 
     def put_log4j(self):
-        for nid in self.nodes:
-            self.ssh.put(self.nodes.get(nid), self.log4j, self.log4j_remote)
+        self.sync.push(self.nodes, self.log4j, self.log4j_remote)
 
     def close_all_cnxs(self):
         for nid in self.nodes:
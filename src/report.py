@@ -0,0 +1,206 @@
+import argparse
+import html
+import json
+import logging
+import os
+
+import numpy as np
+
+from analysis import pct_stats
+from ingest import Store
+
+LOG = logging.getLogger('root')
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+BASELINE = 'NA'
+STATS = ('n', 'mean', 'median', 'ci_lo', 'ci_hi')
+
+
+# test point dimensions of test_digest; NA runs have no PD, load profile runs
+# are kept apart by their tag
+def group_key(m):
+    key = m['algo'] + '|' + str(m['pd']) + '|' + str(m['reqsz'])
+    return key if m.get('tag') is None else key + '|' + m['tag']
+
+
+def _label(algo, pd, tag=None):
+    label = algo if pd is None else algo + ' PD=' + str(pd)
+    return label if tag is None else label + ' ' + tag
+
+
+# steady-state statistics per read percentage for every (algo, PD, reqsz) group,
+# cached in cache_file; a group is recomputed only when the set of its runs or
+# any of their source files changed since the cache was written
+def group_results(store: Store, cache_file: str):
+    cache = dict()
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    groups = dict()
+    for run_id, m in store.runs():
+        groups.setdefault(group_key(m), []).append((run_id, m))
+
+    res = dict()
+    n = 0
+    for key, runs in sorted(groups.items()):
+        sig = [[run_id, m['mtime'], m['size']] for run_id, m in runs]
+        hit = cache.get(key)
+        if hit is not None and hit['sig'] == sig:
+            res[key] = hit
+            continue
+        st = pct_stats([store.load(run_id) for run_id, _ in runs])
+        m = runs[0][1]
+        res[key] = dict(sig=sig, algo=m['algo'], pd=m['pd'], reqsz=m['reqsz'], tag=m.get('tag'),
+                        runs=len(runs), pct=st['pct'].tolist(), **{k: st[k].tolist() for k in STATS})
+        n += 1
+
+    tmp = cache_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(res, f, sort_keys=True)
+    os.replace(tmp, cache_file)
+    LOG.info("report: recomputed %d of %d groups", n, len(res))
+    return res
+
+
+# relative throughput loss in % against the NA run of the same request size,
+# per read percentage; positive means slower than the baseline
+def add_overhead(results: dict):
+    for g in results.values():
+        base = results.get(group_key(dict(algo=BASELINE, pd=None, reqsz=g['reqsz'], tag=g.get('tag'))))
+        g['overhead'] = [None] * len(g['pct'])
+        if base is None or g is base:
+            continue
+        ref = dict(zip(base['pct'], base['mean']))
+        for i, pct in enumerate(g['pct']):
+            if ref.get(pct):
+                g['overhead'][i] = 100.0 * (ref[pct] - g['mean'][i]) / ref[pct]
+    return results
+
+
+def _by_reqsz(results):
+    res = dict()
+    for g in results.values():
+        res.setdefault(g['reqsz'], []).append(g)
+    for gs in res.values():
+        gs.sort(key=lambda g: (str(g.get('tag')), g['algo'] != BASELINE, g['algo'], str(g['pd'])))
+    return dict(sorted(res.items()))
+
+
+def plot(results: dict, out_dir: str):
+    if plt is None:
+        LOG.warning("report: matplotlib not installed, skipping plots")
+        return []
+    files = []
+    by_sz = _by_reqsz(results)
+    for sz, gs in by_sz.items():
+        # throughput vs read %
+        fig, ax = plt.subplots(figsize=(8, 5))
+        for g in gs:
+            ax.errorbar(g['pct'], g['mean'], yerr=[np.subtract(g['mean'], g['ci_lo']),
+                                                   np.subtract(g['ci_hi'], g['mean'])],
+                        label=_label(g['algo'], g['pd'], g.get('tag')), capsize=2,
+                        linestyle='--' if g['pd'] is False else '-')
+        ax.set(xlabel='read %', ylabel='throughput (ops/s)', title=str(sz) + ' B requests')
+        ax.legend(fontsize='small')
+        files.append(_save(fig, out_dir, 'tput_' + str(sz) + 'B.png'))
+
+        # PD=True vs PD=False overhead per read %
+        fig, ax = plt.subplots(figsize=(8, 5))
+        for g in gs:
+            if g['pd'] is None:
+                continue
+            x = [p for p, o in zip(g['pct'], g['overhead']) if o is not None]
+            y = [o for o in g['overhead'] if o is not None]
+            if x:
+                ax.plot(x, y, marker='o', label=_label(g['algo'], g['pd'], g.get('tag')),
+                        linestyle='--' if g['pd'] is False else '-')
+        ax.axhline(0, color='grey', linewidth=0.5)
+        ax.set(xlabel='read %', ylabel='overhead vs ' + BASELINE + ' (%)', title=str(sz) + ' B requests')
+        ax.legend(fontsize='small')
+        files.append(_save(fig, out_dir, 'overhead_' + str(sz) + 'B.png'))
+
+    # overhead vs request size, averaged over read percentages
+    fig, ax = plt.subplots(figsize=(8, 5))
+    lines = dict()
+    for sz, gs in by_sz.items():
+        for g in gs:
+            o = [v for v in g['overhead'] if v is not None]
+            if g['pd'] is not None and o:
+                lines.setdefault((g['algo'], g['pd'], str(g.get('tag'))), []).append((sz, float(np.mean(o))))
+    for (algo, pd, tag), pts in sorted(lines.items()):
+        ax.plot([p[0] for p in pts], [p[1] for p in pts], marker='o',
+                label=_label(algo, pd, None if tag == 'None' else tag),
+                linestyle='--' if pd is False else '-')
+    ax.set_xscale('log', base=2)
+    ax.axhline(0, color='grey', linewidth=0.5)
+    ax.set(xlabel='request size (B)', ylabel='mean overhead vs ' + BASELINE + ' (%)')
+    ax.legend(fontsize='small')
+    files.append(_save(fig, out_dir, 'overhead_vs_reqsz.png'))
+    return files
+
+
+def _save(fig, out_dir, name):
+    fig.tight_layout()
+    fig.savefig(os.path.join(out_dir, name), dpi=100)
+    plt.close(fig)
+    return name
+
+
+def _cell(v, fmt):
+    return '' if v is None else fmt % v
+
+
+def to_html(results: dict, images):
+    out = ['<html><head><meta charset="utf-8"><title>digest benchmark report</title>',
+           '<style>body{font-family:sans-serif} table{border-collapse:collapse;margin-bottom:2em}'
+           ' td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}</style></head><body>',
+           '<h1>Digest benchmark report</h1>',
+           '<p>Steady-state throughput (ops/s, mean of MSER-trimmed samples) per read percentage; '
+           'overhead is the throughput loss against ' + BASELINE + ' at the same request size.</p>']
+    for sz, gs in _by_reqsz(results).items():
+        pcts = sorted(set(p for g in gs for p in g['pct']))
+        out.append('<h2>' + str(sz) + ' B requests</h2><table><tr><th>test</th><th>runs</th>'
+                   + ''.join('<th>' + str(p) + '%</th>' for p in pcts) + '</tr>')
+        for g in gs:
+            mean = dict(zip(g['pct'], g['mean']))
+            over = dict(zip(g['pct'], g['overhead']))
+            out.append('<tr><td style="text-align:left">' + html.escape(_label(g['algo'], g['pd'], g.get('tag')))
+                       + '</td><td>' + str(g['runs']) + '</td>'
+                       + ''.join('<td>' + _cell(mean.get(p), '%.0f')
+                                 + ('<br><small>' + _cell(over.get(p), '%+.1f%%') + '</small>'
+                                    if over.get(p) is not None else '') + '</td>' for p in pcts)
+                       + '</tr>')
+        out.append('</table>')
+    for img in images:
+        out.append('<p><img src="' + html.escape(img) + '"></p>')
+    out.append('</body></html>')
+    return '\n'.join(out)
+
+
+def report(store: Store, out_dir: str):
+    os.makedirs(out_dir, exist_ok=True)
+    results = add_overhead(group_results(store, os.path.join(out_dir, 'cache.json')))
+    images = plot(results, out_dir)
+    path = os.path.join(out_dir, 'index.html')
+    with open(path, 'w') as f:
+        f.write(to_html(results, images))
+    return path
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s: %(message)s")
+    parser = argparse.ArgumentParser(description="overhead of digest algorithms vs NA per read percentage")
+    parser.add_argument('roots', nargs='*', default=['../bench-data', '../res'])
+    parser.add_argument('--store', default='../bench-store')
+    parser.add_argument('--out', default='../report')
+    args = parser.parse_args()
+    store = Store(args.store)
+    store.ingest_dirs(args.roots)
+    print(report(store, args.out))
@@ -1,21 +1,38 @@
+import argparse
 import logging
 import time
 import sys
 import random
 
-from containers import ServerContainer, ClientContainer
-from registry import ZooRegistry
-from collector import LoadManager
+import yaml
+
+from adaptive import Adaptive
+from cluster import Cluster
+from loadprofile import from_spec
+from scaling import KneeSearch
+from config import load_config
+from ledger import Ledger
+from scheduler import Scheduler
 
 LOG = logging.getLogger('root')
 logging.basicConfig(filename="app.log", level=logging.INFO, format="%(asctime)s: %(message)s")
 
-sic = ServerContainer()
-cic = ClientContainer()
-reg = ZooRegistry()
-lm = LoadManager()
-
 exec_time = 180
+# load generator warm-up once all instance containers are known to be registered
+lm_warmup = 60
+# seconds between cpu/memory/disk/network/gc samples of every node, None to disable
+telemetry_interval = 5
+# seconds between mntr scrapes of the registry and the servers under test, None to disable
+mntr_interval = 5
+# percentage phases to capture java flight recordings of the servers under test in, None to disable
+profile_pcts = None
+# pull compressed zookeeper logs, console output and configs of every node after each run
+collect_logs = True
+# record lifecycle events and host clock offsets of each run, see timeline.py
+timeline = True
+# e.g. Adaptive(target=0.02, min_time=60, max_time=exec_time) ends a phase once the 95% ci
+# on its mean throughput is within 2%; None runs every phase for exec_time seconds
+adaptive = None
 #reqsz_bytes = [4096, 2048, 1024]
 #reqsz_bytes = [4096, 2048, 1024, 512, 256, 128, 64, 16]
 reqsz_bytes = [32]
@@ -24,109 +41,37 @@ samples = list(range(0, 101, 10))
 samples.reverse()
 samples.insert(0, 50)
 #samples = random.sample(range(0, 101, 10), 11)
+# load profile replacing the samples, e.g. flat reads with write bursts:
+#   Profile('spiky', [Segment(flat(90, 120) + burst(90, 0, 20, 5, repeat=6))], max_duration=1800)
+# or read from a spec file with --load-profile (see loadprofile.from_spec)
+load_profile = None
+# server container counts of the scaling sweep, one zookeeper server per container
+server_counts = [1, 3]
 
-def setup():
-    reg.setup()
-    time.sleep(30)
-    sic.setup()
-    cic.setup()
-    lm.setup()
-
-
-def start(sys_props):
-    LOG.info("starting registry...")
-    reg.start()
-    # time.sleep(2)
-    LOG.info("starting server ics...")
-    sic.start(sys_props)
-    # time.sleep(2)
-    LOG.info("starting client ics...")
-    cic.start()
-    # time.sleep(2)
-
-
-def stop():
-    LOG.info("stopping client ics...")
-    cic.stop()
-    LOG.info("stopping server ics...")
-    sic.stop()
-    LOG.info("stopping registry ics...")
-    reg.stop()
-
-
-def destroy():
-    cic.destroy()
-    sic.destroy()
-    reg.destroy()
-    lm.destroy()
-
-def cleanall():
-    LOG.info("stopping collector...")
-    lm.stop()
-    LOG.info("stopping client ics...")
-    cic.stop()
-    LOG.info("stopping server ics...")
-    sic.stop()
-    LOG.info("stopping registry ics...")
-    reg.stop()
-    cic.destroy()
-    sic.destroy()
-    reg.destroy()
-    lm.destroy()
-
-def del_data():
-    sic.del_sic_data()
-    reg.del_zkreg_data()
-
-
-no_test = True
-
-def run_test(name='', algo='', sys_prop='', reqsz=1024, servers=3, clients=900):
-    LOG.info("BENCH: %s", name)
-    LOG.info("__config__ - props:%s reqsz:%s server:%s clients:%s",
-             sys_prop, reqsz, servers, clients)
-
-    # start registry and instance containers
-    start(sys_prop)
-
-    #samples = range(0, 101, 10)
-    tm = lm.gen_load_file(exec_time, name, samples)
-
-    LOG.info("start load manager...")
-    #clients=0
-    lm.start("", servers, clients, reqsz)
-    #time.sleep(100000)
-
-    LOG.info("waiting...")
-    time.sleep(tm)
-
-    LOG.info("pull bench data file...")
-    lm.get_bench_data(name)
-
-    LOG.info("stop load manager...")
-    lm.stop()
-
-    LOG.info("stop ics and registry...")
-    # stop registry and instance containers
-    stop()
-
-    LOG.info("delete data...")
-    # delete data from prev run
-    del_data()
-
-
-def test_noadhash_digest():
-    LOG.info("===> test: no adhash (no digest check) ")
+
+# a load profile turns every test point into one point per profile segment
+def _with_profile(points):
+    if load_profile is None:
+        return points
+    load_profile.validate()
+    return [q for p in points for q in load_profile.points(p)]
+
+
+# test points are run_test kwargs
+def noadhash_points():
+    points = []
     for sz in reqsz_bytes:
         name = "NA_" + str(sz) + "B"
-        run_test(name=name, algo="NA", sys_prop=' -Dzookeeper.digest.enabled=false ', reqsz=sz)
+        points.append(dict(name=name, algo="NA", sys_prop=' -Dzookeeper.digest.enabled=false ', reqsz=sz))
+    return _with_profile(points)
 
 
-def test_digest():
+def digest_points():
     #hash_algos = ['CRC-32', 'SHA-256', 'SHA', 'SHA-512', 'MD5']
     hash_algos = ['SHA', 'CRC-32', 'MD5', 'SHA-256', 'SHA-512']
 
     predictive_digest = [False, True]
+    points = []
     for sz in reqsz_bytes:
         for pd in predictive_digest:
             for ha in hash_algos:
@@ -134,16 +79,95 @@ def test_digest():
                 prop = (' -Dzookeeper.digest.enabled=true'
                         + ' -Dzookeeper.digest.algorithm=' + str(ha)
                         + ' -Dzookeeper.predictive.digest=' + str(pd).lower() + ' ')
-                run_test(name=name, algo=ha, sys_prop=prop, reqsz=sz)
+                points.append(dict(name=name, algo=ha, sys_prop=prop, reqsz=sz))
+    return _with_profile(points)
+
+
+def test_noadhash_digest(cluster):
+    LOG.info("===> test: no adhash (no digest check) ")
+    for p in noadhash_points():
+        cluster.run_test(**p)
+
+
+# with resume, test points already collected (per the ledger or bench-data) are skipped
+def test_digest(cluster, ledger, resume=True):
+    points = digest_points()
+    if resume:
+        points = ledger.pending(points)
+    for p in points:
+        ledger.run(p, cluster.run_test)
+
+
+# client count knee per digest algorithm and server count
+def test_scaling(cluster, ledger):
+    search = KneeSearch(cluster, ledger)
+    knees = dict()
+    for p in noadhash_points() + digest_points():
+        for res in search.sweep(p, server_counts):
+            knees[(p['name'], res['servers'])] = res['knee']
+    for (name, servers), knee in sorted(knees.items()):
+        LOG.info("knee: %s servers=%d clients=%s", name, servers, knee)
+    return knees
+
+
+# run the matrix on disjoint cluster slots carved out of scheduler.hosts
+def test_digest_parallel(topo, ledger, n_slots, retries, resume=True):
+    sched = Scheduler(topo, n_slots, retries, exec_time=exec_time, samples=samples,
+                      lm_warmup=lm_warmup, telemetry_interval=telemetry_interval,
+                      mntr_interval=mntr_interval, profile_pcts=profile_pcts,
+                      adaptive=adaptive, collect_logs=collect_logs, timeline=timeline)
+    points = digest_points()
+    if resume:
+        points = ledger.pending(points)
+    sched.setup()
+    sched.run(points, ledger)
+    sched.cleanall()
 
 
 if __name__ == '__main__':
-    if (len(sys.argv) > 1 and sys.argv[1] == "-c"):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--cleanup', action='store_true', help="stop everything and delete remote dirs")
+    parser.add_argument('-t', '--topology', default=None, help="named topology from config.yml")
+    parser.add_argument('-o', '--override', action='append', default=[], metavar='KEY=VALUE',
+                        help="override a config value, e.g. -o registry.clientPort=2182")
+    parser.add_argument('-s', '--slots', type=int, default=None,
+                        help="run test points concurrently on this many cluster slots")
+    parser.add_argument('-r', '--retries', type=int, default=1, help="retries per failed test point")
+    parser.add_argument('--scaling', action='store_true',
+                        help="search the client count knee per test point instead of running the matrix")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="rerun test points even if they were already collected")
+    parser.add_argument('--load-profile', metavar='SPEC.yml',
+                        help="run every test point under this load profile instead of the samples")
+    args = parser.parse_args()
+    if args.load_profile:
+        with open(args.load_profile) as f:
+            load_profile = from_spec(yaml.safe_load(f))
+
+    topo = load_config('config.yml', args.topology, tuple(args.override))
+    cluster = Cluster(topo, exec_time=exec_time, samples=samples, lm_warmup=lm_warmup,
+                      telemetry_interval=telemetry_interval, mntr_interval=mntr_interval,
+                      profile_pcts=profile_pcts, adaptive=adaptive, collect_logs=collect_logs,
+                      timeline=timeline)
+    ledger = Ledger(topo.paths.ledger, topo.paths.bench_data)
+    if args.cleanup:
         print("cleanup..")
-        cleanall()
+        cluster.cleanall()
+        sys.exit()
+    if args.slots is not None:
+        test_digest_parallel(topo, ledger, args.slots, args.retries, not args.no_resume)
         sys.exit()
-    setup()
-    #test_noadhash_digest()
-    test_digest()
-    stop()
-    destroy()
+    cluster.setup()
+    unfinished = ledger.unfinished()
+    if unfinished:
+        LOG.info("resuming after unfinished test points: %s", unfinished)
+    # a previous sweep may have left processes running and ports bound whatever the
+    # ledger says (a failed point stops the sweep); clearing a clean cluster is cheap
+    cluster.recover()
+    #test_noadhash_digest(cluster)
+    if args.scaling:
+        test_scaling(cluster, ledger)
+    else:
+        test_digest(cluster, ledger, not args.no_resume)
+    cluster.stop()
+    cluster.destroy()
@@ -0,0 +1,147 @@
+import logging
+import os
+import re
+
+import numpy as np
+
+import mntr
+from analysis import steady_state
+from ingest import read_samples, to_columns
+
+LOG = logging.getLogger('root')
+
+
+# the mntr scrapes of the run a bench file (<name>_<pulled at>) came from: the
+# latest <name>_<started at>.mntr next to it from before it was pulled
+def _mntr_file(path: str):
+    d, base = os.path.split(path)
+    name, _, pulled = base.rpartition('_')
+    pat = re.compile(re.escape(name) + r'_(\d{14})\.mntr$')
+    found = sorted(m.group(1) for m in map(pat.match, os.listdir(d or '.')) if m and m.group(1) <= pulled)
+    return os.path.join(d, name + '_' + found[-1] + '.mntr') if found else None
+
+
+# mean request latency (ms) of the servers under test at the end of the steady
+# window [t0, t1] (seconds since the first bench sample, which was taken at
+# start seconds of day); zk_avg_latency averages over the server's lifetime, so
+# the last scrape of each server in the window is taken. None without scrapes
+def _latency(path: str, start: int, t0, t1):
+    series = mntr.align(mntr.load(path), start)
+    lat = []
+    for target, cols in series.items():
+        if target.startswith('registry-') or 'zk_avg_latency' not in cols:
+            continue
+        v = cols['zk_avg_latency'][(cols['t_rel'] >= t0) & (cols['t_rel'] <= t1)]
+        v = v[~np.isnan(v)]
+        if v.size:
+            lat.append(v[-1])
+    return float(np.mean(lat)) if lat else None
+
+
+# steady-state mean throughput of a single-phase bench file and the servers'
+# mean latency from the run's mntr scrapes, None where the run has none (the
+# bench file's own latency columns are running means of throughput)
+def measure(path: str):
+    rows, _ = read_samples(path)
+    if not rows:
+        return None
+    cols, start, _ = to_columns(rows)
+    x = cols['tput'].astype(np.float64)
+    keep = steady_state(x, np.zeros(x.size, dtype=np.int64))
+    scrapes = _mntr_file(path)
+    lat = None
+    if scrapes is not None:
+        t = cols['t'][keep]
+        lat = _latency(scrapes, start, t.min(), t.max())
+    return float(x[keep].mean()), lat
+
+
+# searches the client count at which throughput of a test point stops scaling:
+# the client count doubles until throughput grows by less than plateau or mean
+# latency exceeds latency_factor times that of the first step, then the knee is
+# bisected down to resolution (relative) as the smallest client count reaching
+# (1 - plateau) of the peak throughput without the latency blowing up.
+# Latency comes from mntr scrapes (cluster mntr_interval); without them for
+# the first step or a later one the knee is found from throughput alone.
+# Every evaluation is one run_test of a single pct phase lasting secs seconds.
+class KneeSearch:
+
+    def __init__(self, cluster, ledger=None, pct=50, secs=120, start=100, max_clients=12800,
+                 plateau=0.05, latency_factor=3.0, resolution=0.1):
+        self.cluster = cluster
+        self.ledger = ledger
+        self.pct = pct
+        self.secs = secs
+        self.start = start
+        self.max_clients = max_clients
+        self.plateau = plateau
+        self.latency_factor = latency_factor
+        self.resolution = resolution
+
+    def _name(self, point, servers, clients):
+        return point['name'] + '_scale-s' + str(servers) + '-c' + str(clients)
+
+    # (throughput, latency) of point with the given server and client counts; a
+    # run already collected (per the ledger) is measured from its bench file
+    def evaluate(self, point, servers, clients):
+        p = dict(point, name=self._name(point, servers, clients), servers=servers, clients=clients,
+                 n_sic=servers, load=["percentage " + str(self.pct), "sleep " + str(self.secs)])
+        path = None
+        if self.ledger is not None:
+            path = self.ledger.collected(p['name']) if self.ledger.done(p['name']) else None
+            if path is None:
+                path = self.ledger.run(p, self.cluster.run_test)
+        else:
+            path = self.cluster.run_test(**p)
+        res = measure(path) if path else None
+        if res is None:
+            LOG.info("scaling %s: failed", p['name'])
+        elif res[1] is None:
+            LOG.info("scaling %s: %.0f ops/s, no mntr latency", p['name'], res[0])
+        else:
+            LOG.info("scaling %s: %.0f ops/s, %.1f ms mean latency", p['name'], *res)
+        return res
+
+    def search(self, point, servers):
+        seen = dict()
+
+        def run(c):
+            if c not in seen:
+                seen[c] = self.evaluate(point, servers, c)
+            return seen[c]
+
+        def exploded(r):
+            # a zero base latency (sub-millisecond on older servers) has no usable ratio
+            if r[1] is None or not base[1]:
+                return False
+            return r[1] > self.latency_factor * base[1]
+
+        base = run(self.start)
+        if base is None:
+            return dict(servers=servers, knee=None, evaluations=seen)
+        lo, prev, c = self.start, base, self.start * 2
+        hi = None
+        while c <= self.max_clients:
+            r = run(c)
+            if r is None or exploded(r) or r[0] < (1 + self.plateau) * prev[0]:
+                hi = c
+                break
+            lo, prev, c = c, r, c * 2
+        if hi is None:
+            LOG.warning("scaling %s: still scaling at %d clients", point['name'], lo)
+            return dict(servers=servers, knee=None, evaluations=seen)
+
+        while hi - lo > max(1, self.resolution * lo):
+            peak = max(r[0] for r in seen.values() if r is not None and not exploded(r))
+            mid = (lo + hi) // 2
+            r = run(mid)
+            if r is None or exploded(r) or r[0] >= (1 - self.plateau) * peak:
+                hi = mid
+            else:
+                lo = mid
+        LOG.info("scaling %s with %d servers: knee at %d clients", point['name'], servers, hi)
+        return dict(servers=servers, knee=hi, evaluations=seen)
+
+    # knee per server count for one test point
+    def sweep(self, point, server_counts):
+        return [self.search(point, s) for s in server_counts]
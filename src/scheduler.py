@@ -0,0 +1,131 @@
+import logging
+import queue
+import threading
+from dataclasses import replace
+
+from cluster import Cluster
+from config import Topology
+
+LOG = logging.getLogger('root')
+
+ROLES = ('registry', 'server-containers', 'client-containers', 'load-manager')
+
+
+# split scheduler.hosts into n disjoint slots shaped like scheduler.slot-shape and
+# derive one topology per slot; without a host pool the topology is the only slot
+def partition(topo: Topology, n=None):
+    hosts = list(topo.scheduler.hosts)
+    shape = topo.scheduler.slot_shape
+    size = sum(shape.get(r, 0) for r in ROLES)
+    if not hosts or size == 0:
+        return [topo]
+    # every role needs hosts of its own in a slot, and there is one load manager
+    missing = [r for r in ROLES if shape.get(r, 0) < 1]
+    if missing:
+        raise ValueError("scheduler.slot-shape needs at least one host for " + ', '.join(missing))
+    if shape['load-manager'] != 1:
+        raise ValueError("scheduler.slot-shape.load-manager must be 1, not " + str(shape['load-manager']))
+    n = min(n or topo.scheduler.slots, len(hosts) // size)
+    if n < 1:
+        raise ValueError("need " + str(size) + " hosts per slot, have " + str(len(hosts)))
+
+    slots = []
+    for s in range(n):
+        free = hosts[s * size:(s + 1) * size]
+
+        def take(role):
+            k = shape[role]
+            taken = free[:k]
+            del free[:k]
+            return {i + 1: h for i, h in enumerate(taken)}
+
+        # home directories may be shared between hosts, keep slot paths apart
+        suffix = '-s' + str(s)
+        reg, sic, cic, lm = (topo.registry, topo.server_containers,
+                             topo.client_containers, topo.load_manager)
+        reg_cwd = reg.cwd + suffix
+        slots.append(replace(
+            topo, name=topo.name + suffix,
+            registry=replace(reg, nodes=take('registry'), cwd=reg_cwd,
+                             data_dir=reg.data_dir.replace(reg.cwd, reg_cwd, 1)),
+            server_containers=replace(sic, nodes=take('server-containers'), cwd=sic.cwd + suffix,
+                                      ic_test_dir=sic.ic_test_dir.rstrip('/') + suffix,
+                                      ic_data_dir=sic.ic_data_dir.rstrip('/') + suffix,
+                                      ic_log_dir=sic.ic_log_dir.rstrip('/') + suffix),
+            client_containers=replace(cic, nodes=take('client-containers'), cwd=cic.cwd + suffix),
+            load_manager=replace(lm, host=take('load-manager')[1], cwd=lm.cwd + suffix,
+                                 load_file='load' + suffix + '.dat')))
+    return slots
+
+
+# runs test points (kwargs for Cluster.run_test) concurrently, one at a time per
+# slot; a failed point is put back on the queue, so a retry may land on another slot
+class Scheduler:
+
+    def __init__(self, topo: Topology, n_slots=None, retries=1, **kwargs):
+        self.clusters = [Cluster(t, name='slot-' + str(i), **kwargs)
+                         for i, t in enumerate(partition(topo, n_slots))]
+        self.retries = retries
+        self.results = dict()
+        self.lock = threading.Lock()
+        LOG.info("scheduler: %d cluster slots", len(self.clusters))
+
+    def _each(self, fn):
+        threads = [threading.Thread(target=fn, args=(c,)) for c in self.clusters]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def setup(self):
+        self._each(lambda c: c.setup())
+
+    def destroy(self):
+        self._each(lambda c: c.destroy())
+
+    def cleanall(self):
+        self._each(lambda c: c.cleanall())
+
+    # ledger: optional Ledger journaling every attempt
+    def run(self, points, ledger=None):
+        q = queue.Queue()
+        for p in points:
+            q.put((p, 0))
+
+        def worker(cluster):
+            while True:
+                item = q.get()
+                if item is None:
+                    return
+                point, attempt = item
+                try:
+                    if ledger is not None:
+                        ok = ledger.run(point, cluster.run_test)
+                    else:
+                        ok = cluster.run_test(**point)
+                except Exception as e:
+                    LOG.exception("%s: %s failed: %s", cluster.name, point['name'], e)
+                    ok = False
+                    try:
+                        cluster.recover()
+                    except Exception:
+                        LOG.exception("%s: recovery failed", cluster.name)
+                with self.lock:
+                    self.results[point['name']] = bool(ok)
+                if not ok and attempt < self.retries:
+                    LOG.info("requeue %s (attempt %d)", point['name'], attempt + 2)
+                    q.put((point, attempt + 1))
+                q.task_done()
+
+        threads = [threading.Thread(target=worker, args=(c,)) for c in self.clusters]
+        for t in threads:
+            t.start()
+        q.join()
+        for _ in threads:
+            q.put(None)
+        for t in threads:
+            t.join()
+        failed = [n for n, ok in self.results.items() if not ok]
+        if failed:
+            LOG.warning("failed test points: %s", failed)
+        return self.results
@@ -1,6 +1,11 @@
 import logging
+import socket
+import threading
+import time
 import paramiko
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from re import escape
 
 LOG = logging.getLogger('root')
@@ -16,30 +21,68 @@ class Node:
         self.passwd_less = passwd_less
 
 
+# one authenticated transport per host; exec and sftp channels are multiplexed over it
+class _PooledCnx:
+
+    def __init__(self, max_channels: int):
+        self.client = None
+        self.lock = threading.Lock()
+        self.channels = threading.BoundedSemaphore(max_channels)
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+    def is_active(self):
+        if self.client is None:
+            return False
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+
+
 class SshClient(object):
 
     __instance = None
 
+    # max number of concurrently open channels (exec + sftp) per host
+    max_channels = 8
+    # pooled connections unused for longer than this (seconds) are closed
+    idle_timeout = 600
+    # max number of nodes a fan-out operation works on at the same time
+    max_fanout = 32
+    # what SshClient() hands out: 'ssh', or 'local' to run every node's commands
+    # on this machine (see use_backend)
+    backend = 'ssh'
+    # bytes of output kept per stream of a command (the tail of it)
+    max_output = 1 << 20
+    # deadline (seconds) of commands run without an explicit timeout, so that a
+    # hung node cannot stall a sweep forever
+    command_timeout = 900
+    # seconds to keep reading a command's output after its exit status arrived,
+    # until the channel's eof; a process it left in the background may hold the
+    # streams open for good
+    drain_timeout = 5
+    # ssh connections opened so far, reconnects included
+    opened = 0
+
     def __new__(cls):
+        if cls is SshClient and SshClient.backend == 'local':
+            from local_client import LocalClient
+            return LocalClient()
         if cls.__instance is None:
             LOG.info("creating instance of ssh client...")
             cls.__instance = super(SshClient, cls).__new__(cls)
             cls.cnxs = dict()
+            cls.lock = threading.Lock()
         return cls.__instance
 
-    def _get_client(self, node: Node):
-        cli = self.cnxs.get(node.hostname)
-
-        # disable connection caching
-
-        # if cli is not None and cli.get_transport() is not None and cli.get_transport().is_active():
-        #     return cli
-        if cli is not None:
-            try:
-                cli.close()
-            except Exception:
-                pass
-
+    def _connect(self, node: Node):
         cli = paramiko.SSHClient()
         # cli.load_system_host_keys()
         cli.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -47,46 +90,385 @@ class SshClient(object):
             cli.connect(hostname=node.hostname, username=node.usr)
         else:
             cli.connect(hostname=node.hostname, username=node.usr, password=node.passwd)
+        # detect dead peers on long idle gaps between benchmark points
+        cli.get_transport().set_keepalive(30)
+        with self.lock:
+            SshClient.opened += 1
         LOG.info("connected to %s...", node.hostname)
-        self.cnxs[node.hostname] = cli
         return cli
 
-    def execute(self, node: Node, cmd: str):
-        LOG.info('execute - host: %s cmd: %s', node.hostname, cmd)
-        client = self._get_client(node)
-        _in, _out, _err = client.exec_command(cmd)
-        ready = _out.channel.exit_status_ready()
-        rc = _out.channel.recv_exit_status()
-        # LOG.info("rc: %s", rc)
-        return Response(rc, ready, _in, _out, _err)
+    # claim: count the caller as a user of the connection, under the same lock
+    # _evict_idle checks in_use with, so it cannot be evicted once handed out
+    def _get_cnx(self, node: Node, claim=False):
+        self._evict_idle()
+        with self.lock:
+            cnx = self.cnxs.get(node.hostname)
+            if cnx is None:
+                cnx = _PooledCnx(self.max_channels)
+                self.cnxs[node.hostname] = cnx
+            if claim:
+                cnx.in_use += 1
+        return cnx
+
+    def _get_client(self, node: Node):
+        cnx = self._get_cnx(node)
+        with cnx.lock:
+            if not cnx.is_active():
+                if cnx.client is not None:
+                    LOG.info("connection to %s is not active, reconnecting...", node.hostname)
+                cnx.close()
+                cnx.client = self._connect(node)
+            return cnx.client
+
+    def _reset(self, node: Node):
+        cnx = self._get_cnx(node)
+        with cnx.lock:
+            cnx.close()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [h for h, c in self.cnxs.items()
+                    if c.in_use == 0 and now - c.last_used > self.idle_timeout]
+            for hostname in idle:
+                LOG.info("evicting idle connection to %s...", hostname)
+                self.cnxs.pop(hostname).close()
+
+    # hands out the pooled client while holding one of the host's channel slots;
+    # a broken transport is re-established once before giving up. The connection
+    # counts as in use from the moment it is picked, waiting for a slot included
+    @contextmanager
+    def _channel(self, node: Node):
+        cnx = self._get_cnx(node, claim=True)
+        try:
+            with cnx.channels:
+                yield _RetryingClient(self, node)
+        finally:
+            with self.lock:
+                cnx.in_use -= 1
+                cnx.last_used = time.monotonic()
+
+    # runs cmd until it exits or, after timeout (default command_timeout) seconds,
+    # cancels it: the channel is closed and the command's process group (its shell
+    # is a session leader) killed.
+    # Output is read while the command runs, so a chatty command cannot stall on a
+    # full channel window; the last max_output bytes of each stream are kept and
+    # on_output(stream, line) is called for every line as it arrives. With a sink
+    # (binary file object) stdout is written to it as is instead of being kept.
+    # quiet: log the command at debug level, for periodic polling commands
+    def execute(self, node: Node, cmd: str, timeout=None, quiet=False, on_output=None, max_output=None,
+                sink=None):
+        LOG.log(logging.DEBUG if quiet else logging.INFO, 'execute - host: %s cmd: %s', node.hostname, cmd)
+        out = _Capture('stdout', max_output or self.max_output, on_output, sink=sink)
+        err = _Capture('stderr', max_output or self.max_output, on_output, pid_line=True)
+        timeout = self.command_timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._channel(node) as client:
+            # the shell reports its pid first, to be able to cancel it
+            _, _out, _ = client.call(lambda cli: cli.exec_command("echo $$ >&2; " + cmd))
+            chan = _out.channel
+            try:
+                while not chan.exit_status_ready():
+                    if time.monotonic() - started >= timeout:
+                        LOG.warning("timed out after %ss - host: %s cmd: %s", timeout, node.hostname, cmd)
+                        chan.close()
+                        self._cancel(client, node, err.pid)
+                        return Response.completed(-1, out.text(), err.text(), TimeoutError(cmd),
+                                                  time.monotonic() - started)
+                    if not self._pump(chan, out, err):
+                        time.sleep(0.01)
+                # stdout and stderr end with the channel's eof, which may come after
+                # the exit status
+                drain = time.monotonic() + self.drain_timeout
+                while not self._drained(chan) and time.monotonic() < drain:
+                    if not self._pump(chan, out, err):
+                        time.sleep(0.01)
+                if not self._drained(chan):
+                    LOG.debug("no eof %ss after exit - host: %s cmd: %s", self.drain_timeout, node.hostname, cmd)
+                    self._pump(chan, out, err)
+                rc = chan.recv_exit_status()
+            finally:
+                chan.close()
+        return Response.completed(rc, out.text(), err.text(), elapsed=time.monotonic() - started)
+
+    # eof received and everything before it read
+    @staticmethod
+    def _drained(chan):
+        return chan.eof_received and not chan.recv_ready() and not chan.recv_stderr_ready()
+
+    # reads whatever output is available without blocking, returns whether there was any
+    @staticmethod
+    def _pump(chan, out, err):
+        busy = False
+        while chan.recv_ready():
+            out.feed(chan.recv(32768))
+            busy = True
+        while chan.recv_stderr_ready():
+            err.feed(chan.recv_stderr(32768))
+            busy = True
+        return busy
+
+    # kills the process group of a timed out command on a fresh channel
+    def _cancel(self, client, node: Node, pid):
+        if pid is None:
+            LOG.warning("cannot cancel command on %s: pid unknown", node.hostname)
+            return
+        try:
+            _, _out, _ = client.call(lambda cli: cli.exec_command(
+                "kill -TERM -- -" + str(pid) + " 2>/dev/null; sleep 1; kill -KILL -- -" + str(pid) + " 2>/dev/null"))
+            self._wait_exit(_out.channel, 10)
+            _out.channel.close()
+        except Exception as e:
+            LOG.warning("cannot cancel command on %s: %s", node.hostname, e)
+
+    # starts cmd in the background with its output going to log and its pid
+    # recorded in pid_file; cmd must be a single simple command (redirections of
+    # its own are fine) so that the pid recorded is that of the process itself
+    @staticmethod
+    def spawn_cmd(cmd: str, pid_file: str, log: str = '/dev/null'):
+        return cmd + " > " + log + " 2>&1 & echo $! > " + pid_file + "; echo $!"
+
+    # starts cmd in the background (see spawn_cmd), returns its pid or None
+    def spawn(self, node: Node, cmd: str, pid_file: str, log: str = '/dev/null', timeout=60):
+        return self.execute(node, self.spawn_cmd(cmd, pid_file, log), timeout).pid
+
+    # cmd, pid_file and log are each one value for all nodes or a dict of per-node
+    # values; returns {nid: Response}, Response.pid being the pid of the process
+    def spawn_all(self, nodes: dict, cmd, pid_file, log='/dev/null', timeout=60):
+        def pick(v, nid):
+            return v if isinstance(v, str) else v[nid]
+
+        cmds = {nid: self.spawn_cmd(pick(cmd, nid), pick(pid_file, nid), pick(log, nid)) for nid in nodes}
+        res = self.execute_all(nodes, cmds, timeout)
+        for nid, r in res.items():
+            if r.ok and r.pid is None:
+                r.error = RuntimeError("no pid reported")
+        return res
+
+    # runs cmd for as long as the block lasts and yields its stdin and stdout, for
+    # processes driven interactively; the channel is closed on leaving the block
+    @contextmanager
+    def session(self, node: Node, cmd: str):
+        LOG.info('session - host: %s cmd: %s', node.hostname, cmd)
+        with self._channel(node) as client:
+            _in, _out, _err = client.call(lambda cli: cli.exec_command(cmd))
+            try:
+                yield _in, _out
+            finally:
+                _out.channel.close()
+
+    @staticmethod
+    def _wait_exit(channel, timeout):
+        deadline = time.monotonic() + timeout
+        while not channel.exit_status_ready():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # runs fn(nid, node) for every node concurrently and returns {nid: result};
+    # an exception raised for a node is returned in place of its result
+    def map_nodes(self, nodes: dict, fn, max_workers=None):
+        if not nodes:
+            return dict()
+        workers = min(len(nodes), max_workers or self.max_fanout)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {nid: pool.submit(fn, nid, nodes[nid]) for nid in nodes}
+        res = dict()
+        for nid, f in futures.items():
+            e = f.exception()
+            res[nid] = e if e is not None else f.result()
+        return res
+
+    # cmd is either one command for all nodes or a dict of per-node commands
+    def execute_all(self, nodes: dict, cmd, timeout=None, max_workers=None, quiet=False):
+        def run(nid, node):
+            return self.execute(node, cmd if isinstance(cmd, str) else cmd[nid], timeout, quiet)
+
+        return self._gather(nodes, self.map_nodes(nodes, run, max_workers))
+
+    def put_all(self, nodes: dict, src: str, dst: str, max_workers=None):
+        def put(nid, node):
+            self.put(node, src, dst)
+            return Response(0, True, None, None, None)
+
+        return self._gather(nodes, self.map_nodes(nodes, put, max_workers))
+
+    # turns per-node exceptions into failed responses and logs partial failures
+    @staticmethod
+    def _gather(nodes: dict, res: dict):
+        for nid, r in res.items():
+            if isinstance(r, Exception):
+                res[nid] = Response(-1, False, None, None, None, error=r)
+        failed = [nid for nid, r in res.items() if r.error is not None]
+        for nid in failed:
+            LOG.warning("node %s (%s) failed: %s", nid, nodes[nid].hostname, res[nid].error)
+        if failed:
+            LOG.warning("%d of %d nodes failed", len(failed), len(res))
+        return res
+
+    # sftp session over the pooled transport, holding one of the host's channel slots
+    @contextmanager
+    def sftp(self, node: Node):
+        with self._channel(node) as client:
+            sftp = client.call(lambda cli: cli.open_sftp())
+            try:
+                yield sftp
+            finally:
+                sftp.close()
 
     def put(self, remote_host: Node, src: str, dst: str):
         LOG.info("copy - %s on %s:%s", src, remote_host.hostname, dst)
-        self.close(remote_host)
-        sftp = self._get_client(remote_host).open_sftp()
-        sftp.put(src, dst)
+        with self.sftp(remote_host) as sftp:
+            sftp.put(src, dst)
         LOG.info("copied - src:%s  dst:%s:%s", src, remote_host.hostname, dst)
-        sftp.close()
 
     def get(self, remote_host: Node, src: str, dst: str):
-        LOG.info("copy - %s:%s to %s", remote_host.hostname, dst, src)
-        sftp = self._get_client(remote_host).open_sftp()
-        sftp.get(src, dst)
-        sftp.close()
+        LOG.info("copy - %s:%s to %s", remote_host.hostname, src, dst)
+        with self.sftp(remote_host) as sftp:
+            sftp.get(src, dst)
 
     def close(self, node: Node):
         LOG.info("closing connection to %s...", node.hostname)
-        cnx = self.cnxs[node.hostname]
+        with self.lock:
+            cnx = self.cnxs.pop(node.hostname, None)
         if cnx is not None:
             cnx.close()
-            del self.cnxs[node.hostname]
+
+    def close_all(self):
+        with self.lock:
+            cnxs = list(self.cnxs.values())
+            self.cnxs.clear()
+        for cnx in cnxs:
+            cnx.close()
+
+
+# opens a channel on the pooled client, reconnecting once if the transport died
+class _RetryingClient:
+
+    def __init__(self, ssh: SshClient, node: Node):
+        self.ssh = ssh
+        self.node = node
+
+    def call(self, fn):
+        try:
+            return fn(self.ssh._get_client(self.node))
+        except (paramiko.SSHException, EOFError, socket.error) as e:
+            LOG.warning("channel to %s failed (%s), reconnecting...", self.node.hostname, e)
+            self.ssh._reset(self.node)
+            return fn(self.ssh._get_client(self.node))
+
+
+def use_backend(name: str):
+    if name not in ('ssh', 'local'):
+        raise ValueError("unknown backend " + name)
+    if name != SshClient.backend:
+        LOG.info("using %s backend", name)
+    SshClient.backend = name
+
+
+# output of one stream of a running command: keeps the last limit bytes and
+# hands complete lines to on_output(name, line), or writes it all to sink
+class _Capture:
+
+    def __init__(self, name: str, limit: int, on_output=None, pid_line=False, sink=None):
+        self.name = name
+        self.limit = limit
+        self.on_output = on_output
+        self.pid_line = pid_line
+        self.sink = sink
+        self.pid = None
+        self.data = bytearray()
+        self.partial = b''
+        self.dropped = 0
+
+    def feed(self, chunk: bytes):
+        if self.pid_line:
+            self.partial += chunk
+            if b'\n' not in self.partial:
+                return
+            first, chunk = self.partial.split(b'\n', 1)
+            self.partial = b''
+            self.pid_line = False
+            self.pid = int(first) if first.strip().isdigit() else None
+        if self.sink is not None:
+            self.sink.write(chunk)
+            return
+        self.data += chunk
+        if len(self.data) > self.limit:
+            n = len(self.data) - self.limit
+            del self.data[:n]
+            self.dropped += n
+        if self.on_output is not None:
+            lines = (self.partial + chunk).split(b'\n')
+            self.partial = lines.pop()
+            for line in lines:
+                self.on_output(self.name, line.decode(errors='replace'))
+
+    def text(self):
+        if self.on_output is not None and self.partial and not self.pid_line:
+            self.on_output(self.name, self.partial.decode(errors='replace'))
+            self.partial = b''
+        if self.dropped:
+            LOG.debug("%s: dropped the first %d bytes of output", self.name, self.dropped)
+        return self.data.decode(errors='replace')
 
 
 class Response:
 
-    def __init__(self, rc, ready, _in, _out, _err):
+    # response of a command whose output was already collected; elapsed is the
+    # wall time it took in seconds
+    @staticmethod
+    def completed(rc, stdout, stderr, error=None, elapsed=None):
+        r = Response(rc, True, None, None, None, error)
+        r._stdout = stdout
+        r._stderr = stderr
+        r.elapsed = elapsed
+        return r
+
+    def __init__(self, rc, ready, _in, _out, _err, error=None):
         self.rc = rc
         self.ready = ready
         self._in = _in
         self._out = _out
         self._err = _err
+        self.error = error
+        self.elapsed = None
+        self._stdout = None
+        self._stderr = None
+
+    # output is read lazily: commands that background a process (`... &`) keep
+    # the streams open, so only read what arrives within a short grace period
+    @staticmethod
+    def _drain(stream):
+        if stream is None:
+            return ''
+        stream.channel.settimeout(5)
+        data = b''
+        try:
+            data = stream.read()
+        except socket.timeout:
+            pass
+        return data.decode(errors='replace')
+
+    @property
+    def stdout(self):
+        if self._stdout is None:
+            self._stdout = self._drain(self._out)
+        return self._stdout
+
+    @property
+    def stderr(self):
+        if self._stderr is None:
+            self._stderr = self._drain(self._err)
+        return self._stderr
+
+    @property
+    def ok(self):
+        return self.error is None and self.rc == 0
+
+    # pid a spawn command reported (its last line of output)
+    @property
+    def pid(self):
+        lines = self.stdout.split()
+        return int(lines[-1]) if self.ok and lines and lines[-1].isdigit() else None
@@ -0,0 +1,59 @@
+import logging
+
+from ssh_client import SshClient
+
+LOG = logging.getLogger('root')
+
+
+# kill the process whose pid was recorded in pid_file at start, provided its
+# command line still mentions jar (the pid may have been reused); without a pid
+# file fall back to matching `ps` output with grep, then wait up to 10s for it to be gone
+def kill_cmd(pid_file: str, jar: str, grep: str = ''):
+    return ("p=''; if [ -f " + pid_file + " ]; then"
+            + " for x in $(cat " + pid_file + "); do grep -qsF " + jar + " /proc/$x/cmdline && p=\"$p $x\"; done;"
+            + " else p=$(ps aux | grep -v grep | grep " + jar + grep + " | awk '{print $2}'); fi;"
+            + " if [ -n \"$p\" ]; then kill -9 $p 2>/dev/null;"
+            # a killed process nobody reaped yet still answers kill -0, but its cmdline is empty
+            + " for i in $(seq 50); do a=''; for x in $p; do grep -qsF " + jar + " /proc/$x/cmdline && a=1; done;"
+            + " [ -z \"$a\" ] && break; sleep 0.2; done; fi;"
+            + " rm -f " + pid_file)
+
+
+# wait up to 10s for nothing to listen on the tcp ports any more, fail otherwise
+def ports_free_cmd(ports):
+    pat = ':(' + '|'.join(str(p) for p in ports) + ')$'
+    return ("for i in $(seq 50); do (ss -Htln 2>/dev/null || netstat -tln 2>/dev/null) | awk '{print $4}'"
+            + " | grep -qE '" + pat + "' || break; sleep 0.2; done;"
+            + " ! (ss -Htln 2>/dev/null || netstat -tln 2>/dev/null) | awk '{print $4}' | grep -qE '" + pat + "'"
+            + " || { echo ports still bound: " + ','.join(str(p) for p in ports) + "; false; }")
+
+
+# collects teardown commands per host and runs them as one script per host,
+# all hosts at once; commands of one host run in the order they were added
+class Teardown:
+
+    def __init__(self):
+        self.ssh = SshClient()
+        self.hosts = dict()
+        self.steps = dict()
+
+    # cmd is one command for all nodes or a dict of per-node commands
+    def add(self, nodes: dict, cmd):
+        for nid, node in nodes.items():
+            self.hosts.setdefault(node.hostname, node)
+            self.steps.setdefault(node.hostname, []).append(cmd if isinstance(cmd, str) else cmd[nid])
+        return self
+
+    # returns the hosts whose script failed (e.g. ports still bound)
+    def run(self, timeout=120):
+        if not self.hosts:
+            return []
+        # every step runs even if an earlier one failed; the script fails if any did
+        scripts = {h: "rc=0; " + " ".join("{ " + s + "; } || rc=1;" for s in steps) + " exit $rc"
+                   for h, steps in self.steps.items()}
+        LOG.info("teardown on %d hosts (%d steps)", len(self.hosts), sum(len(s) for s in self.steps.values()))
+        res = self.ssh.execute_all(self.hosts, scripts, timeout=timeout)
+        failed = [h for h, r in res.items() if not r.ok]
+        for h in failed:
+            LOG.warning("teardown on %s failed: %s", h, res[h].error or res[h].stdout.strip())
+        return failed
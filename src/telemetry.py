@@ -0,0 +1,158 @@
+import json
+import logging
+import threading
+import time
+
+from ssh_client import SshClient
+
+LOG = logging.getLogger('root')
+
+# one round trip per host and sample: wall clock, cpu, memory, disk and network
+# counters from /proc, and gc counters of every java process we can attach to
+_SEP = '@@'
+SAMPLE_CMD = ("date +%s.%N; echo " + _SEP + "; head -1 /proc/stat; echo " + _SEP
+              + "; grep -E '^(MemTotal|MemFree|MemAvailable|Buffers|Cached):' /proc/meminfo; echo " + _SEP
+              + "; cat /proc/diskstats; echo " + _SEP
+              + "; tail -n +3 /proc/net/dev; echo " + _SEP
+              + "; for p in $(pgrep -x java); do echo pid $p $(tr '\\0' ' ' < /proc/$p/cmdline | grep -o -E '(sic|cic)-[0-9]+|server|generateLoad' | head -1);"
+              + " jstat -gc $p 2>/dev/null; done")
+
+CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+
+
+def parse_sample(out: str):
+    parts = out.split(_SEP + '\n')
+    if len(parts) != 6:
+        return None
+    ts, cpu, mem, disk, net, gc = parts
+    sample = dict(t=float(ts.strip()))
+
+    vals = cpu.split()[1:1 + len(CPU_FIELDS)]
+    sample['cpu'] = dict(zip(CPU_FIELDS, (int(v) for v in vals)))
+
+    sample['mem'] = dict()
+    for line in mem.splitlines():
+        k, v = line.split(':', 1)
+        sample['mem'][k] = int(v.split()[0])
+
+    # reads, sectors read, writes, sectors written, ms doing io
+    sample['disk'] = dict()
+    for line in disk.splitlines():
+        f = line.split()
+        if len(f) < 14 or f[2].startswith(('loop', 'ram')):
+            continue
+        sample['disk'][f[2]] = [int(f[3]), int(f[5]), int(f[7]), int(f[9]), int(f[12])]
+
+    # rx bytes, rx packets, tx bytes, tx packets
+    sample['net'] = dict()
+    for line in net.splitlines():
+        iface, counters = line.split(':', 1)
+        f = counters.split()
+        if iface.strip() != 'lo':
+            sample['net'][iface.strip()] = [int(f[0]), int(f[1]), int(f[8]), int(f[9])]
+
+    # jstat -gc: header line followed by a line of values
+    sample['gc'] = dict()
+    lines = gc.splitlines()
+    i = 0
+    while i < len(lines):
+        f = lines[i].split()
+        if len(f) >= 2 and f[0] == 'pid' and i + 2 < len(lines) and lines[i + 1].split()[:1] == ['S0C']:
+            role = (f[2] if len(f) > 2 else 'java') + '/' + f[1]
+            sample['gc'][role] = {k: float(v) for k, v in zip(lines[i + 1].split(), lines[i + 2].split())
+                                  if v.replace('.', '', 1).isdigit()}
+            i += 3
+        else:
+            i += 1
+    return sample
+
+
+# utilisation and throughput between two samples of the same host
+def rates(prev: dict, cur: dict):
+    dt = cur['t'] - prev['t']
+    if dt <= 0:
+        return None
+    cpu = {k: cur['cpu'][k] - prev['cpu'].get(k, 0) for k in cur['cpu']}
+    total = sum(cpu.values()) or 1
+    res = dict(t=cur['t'], dt=dt,
+               cpu_busy=100.0 * (total - cpu.get('idle', 0) - cpu.get('iowait', 0)) / total,
+               cpu_iowait=100.0 * cpu.get('iowait', 0) / total,
+               mem_used_kb=cur['mem'].get('MemTotal', 0) - cur['mem'].get('MemAvailable', 0))
+    res['disk'] = dict()
+    for dev, c in cur['disk'].items():
+        p = prev['disk'].get(dev)
+        if p is not None:
+            res['disk'][dev] = dict(read_mbs=(c[1] - p[1]) * 512 / dt / 1e6,
+                                    write_mbs=(c[3] - p[3]) * 512 / dt / 1e6,
+                                    util=min(100.0, (c[4] - p[4]) / (dt * 10)))
+    res['net'] = dict()
+    for iface, c in cur['net'].items():
+        p = prev['net'].get(iface)
+        if p is not None:
+            res['net'][iface] = dict(rx_mbs=(c[0] - p[0]) / dt / 1e6, tx_mbs=(c[2] - p[2]) / dt / 1e6)
+    res['gc'] = dict()
+    for role, g in cur['gc'].items():
+        p = prev['gc'].get(role)
+        if p is not None and 'GCT' in g:
+            res['gc'][role] = dict(gc_time_pct=100.0 * (g['GCT'] - p['GCT']) / dt,
+                                   young_gcs=g.get('YGC', 0) - p.get('YGC', 0),
+                                   full_gcs=g.get('FGC', 0) - p.get('FGC', 0))
+    return res
+
+
+# samples host counters of the given nodes ({name: Node}) every interval seconds
+# while a test point runs and appends them as json lines to out
+class Telemetry(threading.Thread):
+
+    def __init__(self, nodes: dict, out: str, interval=5):
+        super(Telemetry, self).__init__(daemon=True)
+        self.ssh = SshClient()
+        # several roles may share a host; sample each host once
+        self.hosts = dict()
+        self.roles = dict()
+        for name, node in nodes.items():
+            self.hosts.setdefault(node.hostname, node)
+            self.roles.setdefault(node.hostname, []).append(name)
+        self.out = out
+        self.interval = interval
+        self.done = threading.Event()
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def run(self):
+        LOG.info("telemetry: sampling %d hosts every %ss into %s", len(self.hosts), self.interval, self.out)
+        with open(self.out, 'a') as f:
+            while True:
+                started = time.time()
+                res = self.ssh.execute_all(self.hosts, SAMPLE_CMD, timeout=self.interval, quiet=True)
+                for host, r in res.items():
+                    sample = parse_sample(r.stdout) if r.ok else None
+                    if sample is None:
+                        continue
+                    sample.update(host=host, roles=self.roles[host], driver_t=started)
+                    f.write(json.dumps(sample, sort_keys=True) + '\n')
+                f.flush()
+                if self.done.wait(max(0, self.interval - (time.time() - started))):
+                    return
+
+
+def load(path: str):
+    per_host = dict()
+    with open(path) as f:
+        for line in f:
+            try:
+                s = json.loads(line)
+            except ValueError:
+                continue
+            per_host.setdefault(s['host'], []).append(s)
+    return per_host
+
+
+# per host list of rates between consecutive samples
+def load_rates(path: str):
+    res = dict()
+    for host, samples in load(path).items():
+        res[host] = [r for r in (rates(a, b) for a, b in zip(samples, samples[1:])) if r is not None]
+    return res
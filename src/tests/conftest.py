@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the harness modules are flat scripts under src/, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
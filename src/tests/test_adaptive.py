@@ -0,0 +1,11 @@
+import math
+
+from adaptive import MIN_SAMPLES, rel_ci
+
+
+def test_rel_ci_needs_min_samples_after_trimming():
+    flat = [1000, 1001, 999, 1000, 1002, 998, 1000, 1001]
+    assert math.isinf(rel_ci(flat[:MIN_SAMPLES - 1]))
+    assert rel_ci(flat) < 0.01
+    # a warm-up ramp trimmed away leaves too few samples to judge
+    assert math.isinf(rel_ci([10, 200, 500, 900, 1000, 1001, 999]))
@@ -0,0 +1,29 @@
+import numpy as np
+
+from analysis import split_phases, steady_state, t_quantile
+
+
+def test_t_quantile_close_to_tables():
+    # two-sided 95%: 2.571 (df=5), 2.228 (df=10), 2.042 (df=30)
+    assert abs(t_quantile(0.95, 5) - 2.571) < 0.03
+    assert abs(t_quantile(0.95, 10) - 2.228) < 0.01
+    assert abs(t_quantile(0.95, 30) - 2.042) < 0.005
+    assert abs(t_quantile(0.95, 1e9) - 1.960) < 0.001
+
+
+def test_steady_state_drops_warmup():
+    x = np.concatenate(([10, 30, 60], np.full(20, 100.0)))
+    keep = steady_state(x, np.zeros(x.size, dtype=np.int64))
+    assert keep.tolist() == [False] * 3 + [True] * 20
+
+
+def test_steady_state_per_group():
+    x = np.array([1, 100, 100, 100, 100, 5, 50, 50, 50, 50], dtype=np.float64)
+    g = split_phases([0] * 5 + [70] * 5)
+    keep = steady_state(x, g)
+    assert keep.tolist() == [False, True, True, True, True, False, True, True, True, True]
+
+
+def test_steady_state_keeps_flat_group_whole():
+    keep = steady_state(np.full(6, 7.0), np.zeros(6, dtype=np.int64))
+    assert keep.all()
@@ -0,0 +1,55 @@
+import os
+
+from collector import LiveTail, levels_of
+from ingest import read_samples
+
+DATA = os.path.join(os.path.dirname(__file__), '..', '..', 'bench-data')
+
+
+def _samples(run):
+    return read_samples(os.path.join(DATA, run))[0]
+
+
+def _replay(run, expected=None):
+    tail = LiveTail(None, None, 'bench.x', expected=expected)
+    for s in _samples(run):
+        tail.add(s)
+        if tail.aborted():
+            break
+    return tail
+
+
+REFERENCE = '4096k-long-dur-good/SHA-512_PD-True_4096KiB_20210322181517'
+
+
+def test_bad_run_aborts_against_reference_levels():
+    tail = _replay('4kib-bad2/SHA-512_PD-True_4096KiB_20210418021259', levels_of(_samples(REFERENCE)))
+    assert tail.aborted()
+    assert "collapsed" in tail.reason
+    # within the first phase, well before the run would have ended
+    assert len(tail.samples) < 10
+
+
+def test_good_run_passes_against_reference_levels():
+    tail = _replay('4096k-long-dur-good/NA_4096KiB_20210323001921',
+                   levels_of(_samples('4096k-long-dur-good/NA_4096KiB_20210322023517')))
+    assert not tail.aborted()
+
+
+def test_bad_run_without_reference_only_trips_own_phase_drop():
+    assert not _replay('4kib-bad2/SHA-512_PD-True_4096KiB_20210418021259').aborted()
+
+
+class _NoFile:
+    def stat(self, path):
+        raise IOError(path)
+
+
+def test_empty_bench_file_times_out_after_start_timeout():
+    tail = LiveTail(None, None, 'bench.x')
+    assert tail.start_timeout == 60
+    tail.poll(_NoFile())
+    assert not tail.aborted()
+    tail.last_growth -= 61
+    tail.poll(_NoFile())
+    assert tail.aborted() and "60s" in tail.reason
@@ -0,0 +1,42 @@
+import numpy as np
+
+from compare import compare
+from ingest import to_columns
+
+
+# one run of a point: per read percentage, n seconds of throughput around level
+def _run(levels, n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    rows, t = [], 0
+    for pct, level in levels:
+        for x in level * (1 + 0.01 * rng.standard_normal(n)):
+            rows.append((t + 1, t, pct, int(x), 1, 1.0, 1))
+            t += 1
+    return to_columns(rows)[0]
+
+
+KEY = ('SHA', False, 32, None)
+
+
+def test_compare_flags_significant_drop():
+    base = {KEY: [_run([(100, 1000), (0, 500)])]}
+    new = {KEY: [_run([(100, 900), (0, 500)], seed=1)]}
+    rows = {r['pct']: r for r in compare(base, new)}
+    assert sorted(rows) == [0, 100]
+    assert rows[100]['regressed'] and -12 < rows[100]['change'] < -8
+    assert rows[100]['ci_hi'] < 0
+    assert not rows[0]['regressed']
+
+
+def test_compare_ignores_gain_and_unmatched_points():
+    base = {KEY: [_run([(100, 1000)])], ('MD5', False, 32, None): [_run([(100, 1000)])]}
+    new = {KEY: [_run([(100, 1100)], seed=1)], ('NA', False, 32, 'spiky'): [_run([(100, 1)])]}
+    (row,) = compare(base, new)
+    assert row['algo'] == 'SHA' and row['change'] > 8 and not row['regressed']
+
+
+def test_compare_below_threshold_is_not_a_regression():
+    base = {KEY: [_run([(50, 1000)])]}
+    new = {KEY: [_run([(50, 980)], seed=1)]}
+    (row,) = compare(base, new, threshold=5.0)
+    assert row['change'] < 0 and not row['regressed']
@@ -0,0 +1,36 @@
+import pytest
+
+from config import _override
+
+
+def conf():
+    return {'registry': {'clientPort': 2181, 'admin': {'4lw.commands.whitelist': 'ruok'}},
+            'server-containers': {'nodes': {1: 'a'}},
+            'load-manager': {'host': 'h'}}
+
+
+def test_override_dotted_leaf_with_non_yaml_value():
+    c = conf()
+    _override(c, 'registry.admin.4lw.commands.whitelist=*')
+    assert c['registry']['admin']['4lw.commands.whitelist'] == '*'
+
+
+def test_override_parses_yaml():
+    c = conf()
+    _override(c, 'registry.clientPort=2182')
+    _override(c, 'server-containers.nodes={1: a, 2: b}')
+    assert c['registry']['clientPort'] == 2182
+    assert c['server-containers']['nodes'] == {1: 'a', 2: 'b'}
+
+
+def test_override_optional_key():
+    c = conf()
+    _override(c, 'load-manager.load-file=load-x.dat')
+    assert c['load-manager']['load-file'] == 'load-x.dat'
+
+
+@pytest.mark.parametrize('expr', ['registry.clientport=2182', 'nosuch.key=1', 'registry.admin.x=1',
+                                  'registry.clientPort'])
+def test_override_rejects_unknown_keys(expr):
+    with pytest.raises(ValueError):
+        _override(conf(), expr)
@@ -0,0 +1,64 @@
+import numpy as np
+
+from ingest import Store, append_run, open_run, parse_lines, parse_name, to_columns, write_run
+
+
+def test_parse_lines_unpadded_time():
+    rows = list(parse_lines(["269402160 4:36:0 70% 457909 457909 460592.0 463275\n"]))
+    assert rows == [(269402160, 4 * 3600 + 36 * 60, 70, 457909, 457909, 460592.0, 463275)]
+
+
+def test_parse_lines_skips_garbage_and_partial_tail():
+    lines = ["saving to bench.x\n",
+             "1 0:0:1 0% 10 10 10.0 10\n",
+             "2 0:0:2 0% 20 10 15.0 20"]
+    assert [r[0] for r in parse_lines(lines)] == [1]
+
+
+def test_to_columns_crosses_midnight():
+    rows = [(1, 86398, 0, 1, 1, 1.0, 1), (2, 86399, 0, 1, 1, 1.0, 1), (3, 0, 0, 1, 1, 1.0, 1)]
+    cols, start, last = to_columns(rows)
+    assert cols['t'].tolist() == [0, 1, 2]
+    assert (start, last) == (86398, 2)
+    assert cols['t'].dtype == np.uint32
+
+
+def test_parse_name_tagged():
+    m = parse_name('/x/SHA_PD-True_32B_spiky-s0_20210420084644')
+    assert m == dict(algo='SHA', pd=True, reqsz=32, tag='spiky-s0', ts='20210420084644')
+    assert parse_name('NA_32B_20210420084644.telemetry') is None
+
+
+def _cols(*samples):
+    return to_columns([(seq, sec, 50, tput, 1, 1.0, 1) for seq, sec, tput in samples])[0]
+
+
+def _line(seq, sec, tput):
+    return "%d 0:0:%d 50%% %d 1 1.0 1\n" % (seq, sec, tput)
+
+
+def test_append_run_drops_records_missing_from_the_index(tmp_path):
+    path = str(tmp_path / 'r.zkb')
+    write_run(path, dict(algo='SHA'), _cols((1, 0, 10), (2, 1, 20)))
+    # appended before a crash, the index still says 2 rows
+    append_run(path, _cols((3, 2, 99)), 2)
+    append_run(path, _cols((3, 2, 30)), 2)
+    meta, rec = open_run(path)
+    assert meta == dict(algo='SHA')
+    assert rec['tput'].tolist() == [10, 20, 30]
+
+
+def test_store_appends_growth_and_reparses_rewrites(tmp_path):
+    src = tmp_path / 'SHA_PD-True_32B_20210420084644'
+    src.write_text(_line(1, 0, 10) + _line(2, 1, 20))
+    store = Store(str(tmp_path / 'store'))
+    assert store.ingest(str(src), 'a')
+    with open(src, 'a') as f:
+        f.write(_line(3, 2, 30))
+    assert store.ingest(str(src), 'a')
+    assert store.load('a')['tput'].tolist() == [10, 20, 30]
+    # rerun under the same name: at least as large, different content
+    src.write_text(_line(1, 5, 11) + _line(2, 6, 21) + _line(3, 7, 31) + _line(4, 8, 41))
+    assert store.ingest(str(src), 'a')
+    assert store.load('a')['tput'].tolist() == [11, 21, 31, 41]
+    assert store.index['a']['rows'] == 4
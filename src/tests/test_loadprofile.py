@@ -0,0 +1,53 @@
+import pytest
+
+from loadprofile import Profile, Segment, burst, flat, from_spec, ramp
+
+
+def test_validate_collects_every_error():
+    p = Profile('bad name', [Segment([flat(101, 10)[0], flat(50, 0)[0]], clients=0)], max_duration=5)
+    with pytest.raises(ValueError) as e:
+        p.validate()
+    msg = str(e.value)
+    for part in ("alphanumeric", "out of range: 101", "whole number of seconds: 0", "invalid clients: 0",
+                 "more than 5s"):
+        assert part in msg
+
+
+def test_validate_rejects_empty_profile():
+    with pytest.raises(ValueError, match="no segments"):
+        Profile('empty', []).validate()
+
+
+def test_points_single_segment():
+    p = Profile('spiky', [Segment(flat(90, 120) + burst(90, 0, 20, 5))]).validate()
+    (q,) = p.points(dict(name='SHA_PD-False_32B', reqsz=32))
+    assert q['name'] == 'SHA_PD-False_32B_spiky'
+    assert q['reqsz'] == 32 and 'clients' not in q
+    assert q['load'] == ['percentage 90', 'sleep 120', 'percentage 90', 'sleep 20', 'percentage 0', 'sleep 5']
+
+
+def test_points_per_segment_overrides():
+    p = Profile('mix', [Segment(flat(50, 10)), Segment(flat(0, 10), clients=300, reqsz=1024)])
+    point = dict(name='NA_32B', reqsz=32)
+    a, b = p.points(point)
+    assert a['name'] == 'NA_32B_mix-s0' and a['reqsz'] == 32
+    assert b['name'] == 'NA_1024B_mix-s1' and b['reqsz'] == 1024 and b['clients'] == 300
+    assert point == dict(name='NA_32B', reqsz=32)
+
+
+def test_from_spec():
+    p = from_spec(dict(name='spiky', segments=[dict(clients=900, phases=[['flat', 90, 120],
+                                                                         ['burst', 90, 0, 20, 5, 2]])]))
+    assert p.segments[0].clients == 900
+    assert p.duration() == 120 + 2 * 25
+    with pytest.raises(ValueError, match="unknown phase kind"):
+        from_spec(dict(name='x', segments=[dict(phases=[['spike', 1]])]))
+
+
+def test_ramp_keeps_the_whole_duration():
+    phases = ramp(0, 100, 300, 6)
+    assert [ph.pct for ph in phases] == [0, 20, 40, 60, 80, 100]
+    assert [ph.secs for ph in phases] == [50] * 6
+    phases = ramp(0, 100, 103, 5)
+    assert [ph.secs for ph in phases] == [20, 20, 20, 20, 23]
+    assert sum(ph.secs for ph in phases) == 103
@@ -0,0 +1,20 @@
+from mntr import parse_reports, ports_by_node
+from ssh_client import Node
+
+# what discover's loop prints for `ls /generateLoad/reports` = [server0, server1, server2]:
+# instance name, then the data of its report node (client, quorum and election address)
+REPORTS = ("server0 sut-a:36561,sut-a:40217,sut-a:43011\n"
+           "server1 sut-b:35129,sut-b:39867,sut-b:41223\n"
+           "server2 sut-b:45651,sut-b:33091,sut-b:37817\n"
+           "server3\n")
+
+
+def test_parse_reports_takes_client_address():
+    assert parse_reports(REPORTS) == dict(server0=('sut-a', 36561), server1=('sut-b', 35129),
+                                          server2=('sut-b', 45651))
+
+
+def test_ports_by_node_maps_instances_by_reported_host():
+    nodes = {1: Node('sut-a', 'u', '', True), 2: Node('sut-b', 'u', '', True), 3: Node('sut-b', 'u', '', True)}
+    found = dict(parse_reports(REPORTS), server9=('elsewhere.invalid', 2181))
+    assert ports_by_node(found, nodes) == {1: [36561], 2: [35129, 45651]}
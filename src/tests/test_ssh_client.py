@@ -0,0 +1,16 @@
+from ssh_client import Node, SshClient
+
+
+def test_claimed_connection_is_not_evicted(monkeypatch):
+    ssh = SshClient()
+    monkeypatch.setattr(SshClient, 'idle_timeout', -1)
+    node = Node('claimed.invalid', 'u', '', True)
+    cnx = ssh._get_cnx(node, claim=True)
+    try:
+        ssh._evict_idle()
+        assert ssh.cnxs.get(node.hostname) is cnx
+    finally:
+        with ssh.lock:
+            cnx.in_use -= 1
+    ssh._evict_idle()
+    assert node.hostname not in ssh.cnxs
@@ -0,0 +1,36 @@
+import json
+
+from timeline import merge
+
+
+def _write(path, lines):
+    path.write_text(''.join(json.dumps(x) + '\n' for x in lines))
+
+
+def test_merge_puts_every_source_on_the_driver_clock(tmp_path):
+    tel = tmp_path / 'p.telemetry'
+    mntr = tmp_path / 'p.mntr'
+    tl = tmp_path / 'p.timeline'
+    _write(tl, [dict(kind='header', name='p', mono=100.0, wall=1000.0),
+                dict(kind='clock', host='a', offset=50.0, rtt=0.2, tz=0, mono=100.5, wall=1000.5),
+                dict(kind='clock', host='a', offset=60.0, rtt=0.9, tz=0, mono=100.6, wall=1000.6),
+                dict(kind='file', role='telemetry', path=str(tel), mono=101.0, wall=1001.0),
+                dict(kind='file', role='mntr', path=str(mntr), mono=101.0, wall=1001.0),
+                dict(kind='lm-start', host='a', mono=110.0, wall=999.0),
+                dict(kind='plan', phases=[[0, 50], [60, 100]], mono=110.1, wall=999.1)])
+    # a's clock runs 50s ahead; b has no clock reading and falls back to driver_t
+    _write(tel, [dict(host='a', t=1070.0, driver_t=1019.0, cpu=[1]),
+                 dict(host='b', t=5.0, driver_t=1021.0, cpu=[2])])
+    _write(mntr, [dict(t=1030.0, target='sic-1', metrics=dict(zk_avg_latency=1.0))])
+
+    m = merge(str(tl))
+    tel_t = {e['host']: e['t'] for e in m.select(source='telemetry')}
+    assert tel_t == dict(a=1020.0, b=1021.0)
+    assert all('driver_t' not in e for e in m.select(source='telemetry'))
+    # monotonic stamps win over the (stepped) wall clock
+    assert [e['t'] for e in m.select(kind='lm-start')] == [1010.0]
+    assert [(e['t'], e['pct']) for e in m.select(kind='phase-planned')] == [(1010.0, 50), (1070.0, 100)]
+    assert [e['t'] for e in m.select(source='mntr')] == [1030.0]
+    assert m.t.tolist() == sorted(m.t.tolist())
+    ((anchor, near),) = m.around('lm-start', before=5, after=10.5, source='telemetry')
+    assert anchor['kind'] == 'lm-start' and [e['host'] for e in near] == ['a']
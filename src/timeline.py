@@ -0,0 +1,239 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+import telemetry
+from ingest import elapsed, read_samples
+from ssh_client import SshClient
+
+LOG = logging.getLogger('root')
+
+CLOCK_CMD = "date '+%s.%N %z'"
+
+
+# "+0200" -> 7200
+def _tz_secs(z: str):
+    sign = -1 if z.startswith('-') else 1
+    z = z.lstrip('+-')
+    return sign * (int(z[:2]) * 3600 + int(z[2:4]) * 60)
+
+
+# per host {offset, rtt, tz}: offset is remote epoch minus driver epoch, taken
+# from the round with the smallest round trip (its midpoint is the best guess of
+# when the remote clock was read); tz is the remote utc offset in seconds, needed
+# to place the time-of-day stamps of bench lines
+def clock_offsets(nodes: dict, rounds=5):
+    hosts = dict()
+    for node in nodes.values():
+        hosts.setdefault(node.hostname, node)
+    ssh = SshClient()
+
+    def read(host, node):
+        t0 = time.time()
+        r = ssh.execute(node, CLOCK_CMD, timeout=10, quiet=True)
+        t1 = time.time()
+        parts = r.stdout.split() if r.ok else []
+        return (t0, t1, float(parts[0]), parts[1]) if len(parts) == 2 else None
+
+    best = dict()
+    for _ in range(rounds):
+        for host, r in ssh.map_nodes(hosts, read).items():
+            if r is None or isinstance(r, Exception):
+                continue
+            t0, t1, remote, tz = r
+            if host not in best or t1 - t0 < best[host]['rtt']:
+                best[host] = dict(offset=remote - (t0 + t1) / 2, rtt=t1 - t0, tz=_tz_secs(tz))
+    missing = set(hosts) - set(best)
+    if missing:
+        LOG.warning("timeline: no clock reading from %s", ', '.join(sorted(missing)))
+    return best
+
+
+# driver side events of one run, appended to path as json lines as they happen:
+# a header line, then one line per event with its monotonic and wall clock stamp.
+# Clock offsets of the cluster's hosts are recorded as 'clock' events and the
+# files written during the run as 'file' events, so that merge() finds them
+class Timeline:
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self.lock = threading.Lock()
+        self.pct = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.f = open(path, 'w')
+        self._write(dict(kind='header', name=name, mono=time.monotonic(), wall=time.time()))
+
+    def _write(self, e):
+        with self.lock:
+            if self.f is not None:
+                self.f.write(json.dumps(e, sort_keys=True) + '\n')
+                self.f.flush()
+
+    def event(self, kind: str, **fields):
+        self._write(dict(fields, kind=kind, mono=time.monotonic(), wall=time.time()))
+
+    def clocks(self, nodes: dict, rounds=5):
+        for host, c in clock_offsets(nodes, rounds).items():
+            self.event('clock', host=host, **c)
+
+    # planned phase switches, as offsets from the load generator start, of a
+    # load file written by LoadManager.gen_load_file
+    def plan(self, load_file: str):
+        at, phases = 0, []
+        with open(load_file) as f:
+            for line in f:
+                cmd = line.split()
+                if len(cmd) == 2 and cmd[0] == 'sleep':
+                    at += int(cmd[1])
+                elif len(cmd) == 2 and cmd[0] == 'percentage':
+                    phases.append([at, int(cmd[1])])
+        self.event('plan', phases=phases)
+
+    # LiveTail subscriber: one event per observed percentage switch
+    def on_sample(self, sample):
+        if sample[2] != self.pct:
+            self.pct = sample[2]
+            self.event('phase', pct=int(sample[2]), seq=int(sample[0]))
+
+    def close(self):
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+
+# one run's entries on the driver's clock, sorted by t (epoch seconds)
+class Merged:
+
+    def __init__(self, name: str, start: float, entries):
+        self.name = name
+        self.start = start
+        self.entries = sorted(entries, key=lambda e: e['t'])
+        self.t = np.array([e['t'] for e in self.entries])
+
+    def select(self, source=None, kind=None, t0=None, t1=None, **fields):
+        lo = 0 if t0 is None else int(np.searchsorted(self.t, t0, 'left'))
+        hi = len(self.entries) if t1 is None else int(np.searchsorted(self.t, t1, 'right'))
+        res = []
+        for e in self.entries[lo:hi]:
+            if source is not None and e['source'] != source:
+                continue
+            if kind is not None and e['kind'] != kind:
+                continue
+            if any(e.get(k) != v for k, v in fields.items()):
+                continue
+            res.append(e)
+        return res
+
+    # [(event, entries from before seconds before to after seconds after it)]
+    # for every entry of kind anchor
+    def around(self, anchor: str, before=30, after=30, **filters):
+        return [(e, self.select(t0=e['t'] - before, t1=e['t'] + after, **filters))
+                for e in self.select(kind=anchor)]
+
+
+def _read(path: str):
+    events = []
+    with open(path) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+# bench samples on the driver clock: the lm host's time of day is put on its
+# epoch using its utc offset and a reference (driver time of the load generator
+# start), unwrapped across midnight and corrected by the host's clock offset
+def _bench(path: str, clock: dict, ref: float):
+    rows, _ = read_samples(path)
+    if not rows:
+        return []
+    sod = np.array([r[1] for r in rows])
+    rel, _, _ = elapsed(sod)
+    local_ref = ref + clock['offset'] + clock['tz']
+    first = local_ref - local_ref % 86400 + sod[0]
+    if first - local_ref > 43200:
+        first -= 86400
+    elif local_ref - first > 43200:
+        first += 86400
+    t = first - clock['tz'] - clock['offset'] + rel
+    return [dict(t=float(x), source='bench', kind='sample', seq=r[0], pct=r[2], tput=r[3], min=r[4],
+                 mean=r[5], max=r[6]) for x, r in zip(t, rows)]
+
+
+# bench samples, driver events, host telemetry and mntr scrapes of one run in
+# one timeline; path is the .timeline file written by Timeline
+def merge(path: str):
+    events = _read(path)
+    head = events[0]
+    mono0, wall0 = head['mono'], head['wall']
+    clocks = dict()
+    files = dict()
+    entries = []
+    for e in events[1:]:
+        # driver times from the monotonic clock, immune to the driver's clock being stepped
+        t = wall0 + e['mono'] - mono0
+        # offsets are estimated at the start and the end of a run, keep the tighter one
+        if e['kind'] == 'clock' and (e['host'] not in clocks or e['rtt'] < clocks[e['host']]['rtt']):
+            clocks[e['host']] = e
+        elif e['kind'] == 'file':
+            files[e['role']] = e['path']
+        fields = {k: v for k, v in e.items() if k not in ('mono', 'wall', 'kind')}
+        entries.append(dict(fields, t=t, source='driver', kind=e['kind']))
+    lm_start = next((x['t'] for x in entries if x['kind'] == 'lm-start'), wall0)
+    plan = next((x for x in entries if x['kind'] == 'plan'), None)
+    if plan is not None:
+        entries += [dict(t=lm_start + at, source='driver', kind='phase-planned', pct=pct)
+                    for at, pct in plan['phases']]
+
+    if files.get('bench') and os.path.exists(files['bench']):
+        lm = next((x['host'] for x in entries if x['kind'] == 'lm-start'), None)
+        clock = clocks.get(lm, dict(offset=0.0, tz=time.localtime().tm_gmtoff))
+        entries += _bench(files['bench'], clock, lm_start)
+    if files.get('telemetry') and os.path.exists(files['telemetry']):
+        for host, samples in telemetry.load(files['telemetry']).items():
+            off = clocks[host]['offset'] if host in clocks else None
+            # t is the host's own clock, driver_t when the driver asked for the sample
+            for s in samples:
+                t = s['driver_t'] if off is None else s['t'] - off
+                entries.append(dict({k: v for k, v in s.items() if k not in ('t', 'driver_t')},
+                                    t=t, source='telemetry', kind='sample'))
+    if files.get('mntr') and os.path.exists(files['mntr']):
+        for s in _read(files['mntr']):
+            entries.append(dict(s, source='mntr', kind='sample'))
+    return Merged(head['name'], wall0, entries)
+
+
+def _describe(e):
+    skip = ('t', 'source', 'kind', 'metrics', 'cpu', 'mem', 'disk', 'net', 'gc')
+    return ' '.join(k + '=' + str(v) for k, v in sorted(e.items()) if k not in skip)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s: %(message)s")
+    parser = argparse.ArgumentParser(description="print the merged timeline of a run")
+    parser.add_argument('timeline', help="the run's .timeline file")
+    parser.add_argument('--source', help="driver, bench, telemetry or mntr")
+    parser.add_argument('--kind', help="e.g. phase, lm-start, sample")
+    parser.add_argument('--around', help="only entries near every event of this kind")
+    parser.add_argument('--window', type=float, default=30, help="seconds before and after --around events")
+    args = parser.parse_args()
+
+    m = merge(args.timeline)
+    if args.around:
+        groups = m.around(args.around, args.window, args.window, source=args.source, kind=args.kind)
+    else:
+        groups = [(None, m.select(source=args.source, kind=args.kind))]
+    for anchor, entries in groups:
+        if anchor is not None:
+            print("-- %s at %+.1fs" % (anchor['kind'], anchor['t'] - m.start))
+        for e in entries:
+            print("%+10.2f %-9s %-14s %s" % (e['t'] - m.start, e['source'], e['kind'], _describe(e)))